@@ -1,11 +1,35 @@
 import os
 import shutil  # Import shutil for deleting directories
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 
 import gitlab
+from gitlab.v4.objects import Group
 
 import helper.config as config
+from helper.fixtures import fixture_mode, recorded
+
+# clones and pulls mostly wait for the network, this many git processes run at once
+git_parallelism = getattr(config, "git_parallelism", 8)
+# a git asking for credentials would block its worker forever
+git_env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+# "subgroups" lists all projects below the group in one stream, "tree" walks group by group
+gitlab_discovery = getattr(config, "gitlab_discovery", "subgroups")
+
+# data groups where old projects are interesting
+include_old_subgroups = [
+    "digital/insurance/team-data",
+    "digital/insurance/team-data-obungi",
+]
+# uninteresting subgroups, neither they nor their subgroups are synced - , "digital/insurance/car"
+skipped_subgroups = [
+    "digital/insurance/predictiveanalytics",
+    "digital/insurance/camunda-hackday",
+    "digital/insurance/choreography",
+    "digital/insurance/property",
+]
 
 
 def handle_remove_readonly(func, path, exc_info):
@@ -18,6 +42,187 @@ def handle_remove_readonly(func, path, exc_info):
         raise
 
 
+# api listings as plain attribute dicts, recorded in fixture mode
+def list_group_projects(group, page, per_page):
+    return recorded(
+        "gitlab",
+        f"groups/{group.id}/projects?page={page}&per_page={per_page}",
+        lambda: [
+            project.attributes
+            for project in group.projects.list(per_page=per_page, page=page)
+        ],
+    )
+
+
+def list_subgroups(group):
+    return recorded(
+        "gitlab",
+        f"groups/{group.id}/subgroups",
+        lambda: [subgroup.attributes for subgroup in group.subgroups.list()],
+    )
+
+
+# all projects of the group and its subgroups, archived or not, in one paginated stream
+# keyset pagination avoids the slow deep offsets, gitlab versions without keyset support for
+# group projects answer with an error and are listed with offset pagination instead
+def list_all_group_projects(group, archived):
+    def fetch():
+        options = {
+            "include_subgroups": True,
+            "archived": archived,
+            "simple": True,
+            "order_by": "id",
+            "sort": "asc",
+            "per_page": 100,
+            "iterator": True,
+        }
+        try:
+            projects = group.projects.list(pagination="keyset", **options)
+            return [project.attributes for project in projects]
+        except gitlab.exceptions.GitlabListError as e:
+            print(f"Keyset pagination not available ({e}), using offset pagination")
+            return [project.attributes for project in group.projects.list(**options)]
+
+    return recorded(
+        "gitlab",
+        f"groups/{group.id}/projects?include_subgroups=true&archived={archived}",
+        fetch,
+    )
+
+
+def _in_groups(namespace, group_paths):
+    return any(
+        namespace == path or namespace.startswith(path + "/") for path in group_paths
+    )
+
+
+def get_group(group_id):
+    attributes = recorded(
+        "gitlab", f"groups/{group_id}", lambda: gl.groups.get(group_id).attributes
+    )
+    # lazy objects do not request the group again, its attributes are known already
+    return Group(gl.groups, attributes, lazy=True)
+
+
+# runs the git commands of one repository one after the other
+# returns (exit code of the first failing command or 0, captured output, seconds)
+def run_git_commands(commands):
+    start = time.perf_counter()
+    exit_code = 0
+    output = ""
+    for command in commands:
+        result = subprocess.run(
+            command,
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            errors="replace",
+            env=git_env,
+        )
+        output += "$ " + " ".join(command) + "\n" + result.stdout + result.stderr
+        exit_code = exit_code or result.returncode
+    return (exit_code, output, time.perf_counter() - start)
+
+
+# runs the clone/pull jobs of fetch_projects in a bounded worker pool
+# jobs are (name, action, commands), returns one result dict per job
+def sync_repositories(jobs, parallelism=None):
+    if parallelism is None:
+        parallelism = git_parallelism
+    results = []
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = {
+            executor.submit(run_git_commands, commands): (name, action)
+            for name, action, commands in jobs
+        }
+        # one line per finished repository, the git output is kept for the summary
+        for future in as_completed(futures):
+            name, action = futures[future]
+            exit_code, output, seconds = future.result()
+            results.append(
+                {
+                    "name": name,
+                    "action": action,
+                    "exit_code": exit_code,
+                    "output": output,
+                    "seconds": seconds,
+                }
+            )
+            print(
+                f"[{len(results)}/{len(jobs)}] {action} {name}: "
+                f"{'ok' if exit_code == 0 else 'failed (' + str(exit_code) + ')'} "
+                f"in {seconds:.1f}s"
+            )
+    return results
+
+
+def print_sync_summary(results, seconds):
+    failed = [result for result in results if result["exit_code"] != 0]
+    print(
+        f"\n{len(results)} repositories synced in {seconds:.1f}s: "
+        f"{sum(r['action'] == 'clone' and not r['exit_code'] for r in results)} cloned, "
+        f"{sum(r['action'] == 'pull' and not r['exit_code'] for r in results)} updated, "
+        f"{len(failed)} failed"
+    )
+    slowest = sorted(results, key=lambda result: -result["seconds"])[:5]
+    if slowest:
+        print("Slowest:")
+        for result in slowest:
+            print(f"  {result['seconds']:6.1f}s {result['action']} {result['name']}")
+    for result in failed:
+        print(f"\nFailed {result['action']} {result['name']}:")
+        print(result["output"].rstrip())
+
+
+# decides by archive state and last activity whether a project is cloned/pulled or deleted
+def sync_project(
+    project,
+    project_path,
+    include_archived,
+    include_old,
+    skipped_old_projects,
+    git_jobs,
+):
+    last_two_years = (datetime.now() - timedelta(days=2 * 365)).strftime("%Y-%m-%d")
+    last_activity = project["last_activity_at"][:10]
+    is_archived = project["archived"]
+    is_old = last_activity < last_two_years
+    is_active = not is_archived and not is_old
+
+    if (include_archived and is_archived) or (include_old and is_old) or is_active:
+        if not os.path.exists(project_path):
+            git_jobs.append(
+                (
+                    project["path"],
+                    "clone",
+                    [["git", "clone", project["http_url_to_repo"], project_path]],
+                )
+            )
+        else:
+            git_jobs.append(
+                (
+                    project["path"],
+                    "pull",
+                    [
+                        ["git", "-C", project_path, "checkout", "master"],
+                        ["git", "-C", project_path, "pull"],
+                    ],
+                )
+            )
+    elif is_old and not is_archived:
+        skipped_old_projects.append(
+            f"{project['path']} (last activity: {last_activity})"
+        )
+        if os.path.exists(project_path):
+            print(f"Deleting old project {project['path']} at {project_path}...")
+            shutil.rmtree(project_path, onerror=handle_remove_readonly)
+    elif os.path.exists(project_path):
+        print(f"Deleting archived/old project {project['path']} at {project_path}...")
+        shutil.rmtree(project_path, onerror=handle_remove_readonly)
+
+
+# walks the group and its subgroups, deletes repositories that are no longer wanted
+# and appends a (name, action, commands) job per repository to clone or pull to git_jobs
 def fetch_projects(
     base_path,
     group,
@@ -25,74 +230,48 @@ def fetch_projects(
     include_archived=False,
     include_old=False,
     skipped_old_projects=None,
+    git_jobs=None,
 ):
     if skipped_old_projects is None:
         skipped_old_projects = []
+    if git_jobs is None:
+        git_jobs = []
     page = 1
     per_page = 100
 
     while True:
-        projects = group.projects.list(per_page=per_page, page=page)
+        projects = list_group_projects(group, page, per_page)
         if not projects:
             break
 
         for project in projects:
             project_path = os.path.join(
-                base_path, fetch_subfolder, project.path + ".git"
+                base_path, fetch_subfolder, project["path"] + ".git"
             )
-            last_two_years = (datetime.now() - timedelta(days=2 * 365)).strftime(
-                "%Y-%m-%d"
+            sync_project(
+                project,
+                project_path,
+                include_archived,
+                include_old,
+                skipped_old_projects,
+                git_jobs,
             )
-            last_activity = project.attributes["last_activity_at"][:10]
-            is_archived = project.attributes["archived"]
-            is_old = last_activity < last_two_years
-            is_active = not is_archived and not is_old
-
-            if (
-                (include_archived and is_archived)
-                or (include_old and is_old)
-                or is_active
-            ):
-                if not os.path.exists(project_path):
-                    print(f"Cloning {project.path}...")
-                    subprocess.call(
-                        ["git", "clone", project.http_url_to_repo, project_path]
-                    )
-                else:
-                    print(f"Updating {project.path} at {project_path}...")
-                    subprocess.call(["git", "-C", project_path, "checkout", "master"])
-                    subprocess.call(["git", "-C", project_path, "pull"])
-            elif is_old and not is_archived:
-                skipped_old_projects.append(
-                    f"{project.path} (last activity: {last_activity})"
-                )
-                if os.path.exists(project_path):
-                    print(f"Deleting old project {project.path} at {project_path}...")
-                    shutil.rmtree(project_path, onerror=handle_remove_readonly)
-            elif os.path.exists(project_path):
-                print(
-                    f"Deleting archived/old project {project.path} at {project_path}..."
-                )
-                shutil.rmtree(project_path, onerror=handle_remove_readonly)
 
         page += 1
 
     # process subgroups
     print(f"Fetching subgroups for group: {group.name}")
-    subgroups = group.subgroups.list()
+    subgroups = list_subgroups(group)
     for subgroup in subgroups:
-        print(f"Fetching projects from subgroup: {subgroup.name}")
-        new_group = gl.groups.get(subgroup.id)
+        print(f"Fetching projects from subgroup: {subgroup['name']}")
+        new_group = Group(gl.groups, subgroup, lazy=True)
         if fetch_subfolder:
             # If fetch_subfolder is provided, append subgroup path to it
-            new_subfolder = os.path.join(fetch_subfolder, subgroup.path)
+            new_subfolder = os.path.join(fetch_subfolder, subgroup["path"])
         else:
-            new_subfolder = subgroup.path
+            new_subfolder = subgroup["path"]
         # Set include_old True for specific subgroups
-        if subgroup.full_path in [
-            "digital/insurance/team-data",
-            "digital/insurance/team-data-obungi",
-        ]:  # data groups where old projects are interesting
+        if subgroup["full_path"] in include_old_subgroups:
             fetch_projects(
                 base_path,
                 new_group,
@@ -100,14 +279,10 @@ def fetch_projects(
                 include_archived,
                 True,
                 skipped_old_projects,
+                git_jobs,
             )
-        elif subgroup.full_path in [
-            "digital/insurance/predictiveanalytics",
-            "digital/insurance/camunda-hackday",
-            "digital/insurance/choreography",
-            "digital/insurance/property",
-        ]:  # uninteresting subgroups - , "digital/insurance/car"
-            print(f"Skipping further subgroups under {subgroup.full_path}")
+        elif subgroup["full_path"] in skipped_subgroups:
+            print(f"Skipping further subgroups under {subgroup['full_path']}")
             continue
         else:
             fetch_projects(
@@ -117,19 +292,69 @@ def fetch_projects(
                 include_archived,
                 include_old,
                 skipped_old_projects,
+                git_jobs,
             )
 
     return skipped_old_projects
 
 
+# same result as fetch_projects, but the projects of all subgroups are listed at once and the
+# subgroup rules are applied to their namespace paths, a few pages instead of a walk per group
+def fetch_all_projects(
+    base_path,
+    group,
+    fetch_subfolder,
+    include_archived=False,
+    include_old=False,
+    skipped_old_projects=None,
+    git_jobs=None,
+):
+    if skipped_old_projects is None:
+        skipped_old_projects = []
+    if git_jobs is None:
+        git_jobs = []
+
+    print(f"Fetching projects of {group.full_path} and all its subgroups")
+    projects = []
+    for archived in (False, True):
+        # the simple project representation has no archived flag
+        for project in list_all_group_projects(group, archived):
+            project["archived"] = archived
+            projects.append(project)
+
+    for project in projects:
+        namespace = project["path_with_namespace"].rsplit("/", 1)[0]
+        if _in_groups(namespace, skipped_subgroups):
+            continue
+        # subgroups are mapped to subfolders like in fetch_projects
+        subgroup_path = namespace[len(group.full_path) :].strip("/")
+        project_path = os.path.join(
+            base_path,
+            fetch_subfolder,
+            *(subgroup_path.split("/") if subgroup_path else []),
+            project["path"] + ".git",
+        )
+        sync_project(
+            project,
+            project_path,
+            include_archived,
+            include_old or _in_groups(namespace, include_old_subgroups),
+            skipped_old_projects,
+            git_jobs,
+        )
+
+    return skipped_old_projects
+
+
 if __name__ == "__main__":
     api_token = config.eucon_gitlab_api_token
     gitlaburl = "https://gitlab.eucon-services.com"
 
     gl = gitlab.Gitlab(url=gitlaburl, private_token=api_token)
 
-    gl.auth()
-    projects = gl.projects.list(iterator=True)
+    # PY_SINGLE_SCRIPTS_FIXTURES=replay serves the recorded group listings without gitlab
+    if fixture_mode != "replay":
+        gl.auth()
 
     # Uncomment the appropriate path based on your environment
     #    base_path = 'C:\\proj\\euc' # Laptop Vit Windows
@@ -141,7 +366,7 @@ if __name__ == "__main__":
 
     # https://gitlab.eucon-services.com/digital/insurance
     # 42 = digital -> 43 = shared | 53 = Insurance -> 158 = Team-Data | 1550 = team-data-obungi | 172 = multi-domain-case-suite | 56 = shared
-    group = gl.groups.get(42)
+    group = get_group(42)
 
     # Remove 'digital/' prefix from group.full_path if present
     group_path = group.full_path
@@ -152,14 +377,21 @@ if __name__ == "__main__":
     else:
         subfolder = group_path
 
-    skipped_old_projects = fetch_projects(
+    git_jobs = []
+    discover = fetch_all_projects if gitlab_discovery == "subgroups" else fetch_projects
+    skipped_old_projects = discover(
         base_path,
         group=group,
         fetch_subfolder=subfolder,
         include_archived=False,
         include_old=True,
+        git_jobs=git_jobs,
     )
 
+    start = time.perf_counter()
+    results = sync_repositories(git_jobs)
+    print_sync_summary(results, time.perf_counter() - start)
+
     if skipped_old_projects:
         print("\nProjects skipped because they are too old:")
         for proj in skipped_old_projects:
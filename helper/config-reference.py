@@ -3,5 +3,70 @@ toggl_api_token = "token"
 
 jira_user = "vitali_prenger"
 jira_token = "token"
+# accountId of jira cloud, own worklogs are recognized by it or by the jira_user email
+jira_account_id = "accountId"
 
 eucon_gitlab_api_token = "token"
+
+# optional: disk cache for toggl clients/projects
+# toggl_cache_dir = "/path/to/cache"
+# toggl_metadata_ttl_seconds = 12 * 3600
+
+# optional: local sqlite copy of the toggl time entries, only changes are downloaded
+# toggl_use_entry_store = True
+# toggl_entry_store = "/path/to/toggl_entries.sqlite"
+
+# optional: toggl request rate, 402 quota resets up to this many seconds are waited for
+# toggl_requests_per_second = 1.0
+# toggl_request_burst = 3
+# toggl_max_quota_wait_seconds = 3600
+
+# optional: "loop" or "columnar" (numpy) aggregation of the toggl entries
+# toggl_aggregation_engine = "loop"
+
+# optional: classification rules for toggl entries, see toggl_rules.default_rules
+# toggl_classification_rules = {
+#     "skip_descriptions": ["$"],
+#     "skip_clients": ["Vit"],
+#     "travel_keywords": ["reisen"],
+#     "travel_suffix": " - Reisen",
+#     "tickets": [{"project": "2779 ", "pattern": r"\w+-\d+"}],
+# }
+
+# optional: "record" saves all toggl/jira/gitlab responses, "replay" serves them offline
+# (the environment variable PY_SINGLE_SCRIPTS_FIXTURES overrides this)
+# fixture_mode = "record"
+# fixture_dir = "/path/to/fixtures"
+
+# optional: concurrent jira requests and retries of 429/503 responses
+# jira_max_workers = 8
+# jira_max_retries = 5
+# jira_max_retry_delay_seconds = 60
+# optional: "bulk" (worklog/updated + worklog/list) or "issues" (jql search + worklogs per issue)
+# jira_worklog_fetch = "bulk"
+
+# optional: toggl to jira sync, policy "auto" replaces differing worklogs, "skip" only adds
+# missing ones, "ask" asks for every replacement before anything is written
+# jira_sync_policy = "ask"
+# jira_sync_tolerance_seconds = 60
+# jira_sync_delete_missing = False
+# jira_sync_dry_run = False
+# optional: journal of synced toggl entries, unchanged ticket cells are skipped without asking jira
+# jira_sync_use_journal = True
+# jira_sync_journal = "/path/to/jira_sync_journal.sqlite"
+# optional: local full-text index of toggl_query.py
+# toggl_search_index = "/path/to/toggl_search.sqlite"
+# optional: "xlwings" updates the ANW in a running Excel, "openpyxl" edits the file headless
+# (without Excel the overtime formulas are not calculated, the month switch is skipped)
+# anw_backend = "openpyxl"
+# optional: folder of the ANW files, defaults to the OneDrive folder of the platform
+# anw_folder = "/path/to/Arbeitsnachweis"
+# "diff" writes only the changed ANW cells and logs them, "full" rewrites all day columns
+# anw_write_mode = "diff"
+# optional: python toggl_to_jira_transfer.py watch, polling interval and sync policy
+# jira_watch_interval_seconds = 300
+# jira_watch_policy = "auto"
+# optional: concurrent git clones/pulls of git_checkout_multiple_repos.py
+# git_parallelism = 8
+# optional: "subgroups" lists all gitlab projects in one stream, "tree" walks group by group
+# gitlab_discovery = "subgroups"
@@ -0,0 +1,69 @@
+try:
+    from . import config
+except ImportError:
+    import config
+
+import json
+import logging
+import os
+from hashlib import sha1
+
+# "record" saves every api response, "replay" serves them without any network access
+# the jira sync does not write to jira in replay mode and bypasses its journal in both modes
+# set PY_SINGLE_SCRIPTS_FIXTURES=record|replay or fixture_mode in the config
+fixture_mode = os.environ.get(
+    "PY_SINGLE_SCRIPTS_FIXTURES", getattr(config, "fixture_mode", None)
+)
+fixture_dir = getattr(
+    config,
+    "fixture_dir",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures"
+    ),
+)
+# bump when the recorded format changes, old recordings are then ignored
+fixture_version = "v1"
+
+
+def fixtures_active():
+    return fixture_mode in ("record", "replay")
+
+
+def fixtures_replaying():
+    return fixture_mode == "replay"
+
+
+def _fixture_file(service, key):
+    return os.path.join(
+        fixture_dir,
+        fixture_version,
+        service,
+        sha1(key.encode("utf-8")).hexdigest() + ".json",
+    )
+
+
+# returns fetch() and records the result, or the recorded result in replay mode
+# key must identify the request completely (path and parameters), the result must be json serializable
+def recorded(service, key, fetch):
+    fixture_file = _fixture_file(service, key)
+    if fixture_mode == "replay":
+        try:
+            with open(fixture_file, "r", encoding="utf-8") as f:
+                return json.load(f)["response"]
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                "No "
+                + service
+                + " fixture recorded for '"
+                + key
+                + "' in "
+                + fixture_dir
+            )
+
+    response = fetch()
+    if fixture_mode == "record":
+        os.makedirs(os.path.dirname(fixture_file), exist_ok=True)
+        with open(fixture_file, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "response": response}, f)
+        logging.debug("recorded " + service + " fixture " + key)
+    return response
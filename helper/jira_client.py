@@ -0,0 +1,130 @@
+try:
+    from . import config
+except ImportError:
+    import config
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from jira import JIRA
+from requests.adapters import HTTPAdapter
+
+# concurrent requests against jira, the pool of the shared session has the same size
+max_workers = getattr(config, "jira_max_workers", 8)
+# 429 and 503 responses are retried by the jira session with Retry-After or exponential backoff
+max_retries = getattr(config, "jira_max_retries", 5)
+max_retry_delay_seconds = getattr(config, "jira_max_retry_delay_seconds", 60)
+search_page_size = 100
+worklog_page_size = 1000
+
+_jira = None
+_jira_lock = threading.Lock()
+
+
+# one jira client and keep-alive session per run, shared by all threads
+def get_jira(server):
+    global _jira
+    with _jira_lock:
+        if _jira is None:
+            _jira = JIRA(
+                basic_auth=(config.jira_user, config.jira_token),
+                options={"server": server},
+                max_retries=max_retries,
+            )
+            _jira._session.max_retry_delay = max_retry_delay_seconds
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            _jira._session.mount("https://", adapter)
+            _jira._session.mount("http://", adapter)
+        return _jira
+
+
+# raw json of all issues matching the jql, every page is loaded
+# jira cloud pages with a token, so its pages are requested one after the other. jira server
+# reports the total on the first page and the remaining pages are requested concurrently
+def search_all_issues(jira, jql, fields="key"):
+    if jira._is_cloud:
+        issues = []
+        params = {"jql": jql, "fields": fields, "maxResults": search_page_size}
+        while True:
+            page = jira._get_json("search/jql", params)
+            issues.extend(page["issues"])
+            if page.get("isLast", True) or not page.get("nextPageToken"):
+                return issues
+            params["nextPageToken"] = page["nextPageToken"]
+
+    def fetch_page(start_at):
+        return jira._get_json(
+            "search",
+            {
+                "jql": jql,
+                "fields": fields,
+                "startAt": start_at,
+                "maxResults": search_page_size,
+            },
+        )
+
+    first_page = fetch_page(0)
+    issues = list(first_page["issues"])
+    # the server may return smaller pages than requested
+    page_size = first_page.get("maxResults") or search_page_size
+    offsets = range(len(issues), first_page.get("total", 0), page_size)
+    if len(issues) == 0 or len(offsets) == 0:
+        return issues
+    logging.debug("search " + str(len(offsets)) + " more jira pages for " + jql)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page in executor.map(fetch_page, offsets):
+            issues.extend(page["issues"])
+    return issues
+
+
+# raw json of all worklogs of one issue, issues with many worklogs are paged
+def get_issue_worklogs(jira, issue_key):
+    worklogs = []
+    while True:
+        page = jira._get_json(
+            "issue/" + issue_key + "/worklog",
+            {"startAt": len(worklogs), "maxResults": worklog_page_size},
+        )
+        worklogs.extend(page["worklogs"])
+        if not page["worklogs"] or len(worklogs) >= page.get("total", 0):
+            return worklogs
+
+
+# issue key -> raw worklogs, loaded with at most max_workers requests in flight
+def get_worklogs_of_issues(jira, issue_keys):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(
+            zip(
+                issue_keys,
+                executor.map(lambda key: get_issue_worklogs(jira, key), issue_keys),
+            )
+        )
+
+
+# ids of all worklogs changed since the epoch milliseconds, every page is loaded
+def get_updated_worklog_ids(jira, since):
+    worklog_ids = []
+    while True:
+        page = jira._get_json("worklog/updated", {"since": since})
+        worklog_ids.extend(value["worklogId"] for value in page["values"])
+        if page.get("lastPage", True) or not page["values"]:
+            return worklog_ids
+        since = page["until"]
+
+
+# raw json of the worklogs with these ids, at most 1000 per request
+def get_worklogs_by_ids(jira, worklog_ids):
+    return jira._get_json("worklog/list", {"ids": worklog_ids}, use_post=True)
+
+
+# changes or deletes one worklog by id with a single request
+# the public api (jira.worklog(...).update/delete) loads the worklog first, which doubles
+# the requests of a sync. the shared resilient session still retries and raises JIRAError
+def send_worklog_request(jira, method, issue_key, worklog_id, payload=None):
+    url = jira._get_url("issue/" + issue_key + "/worklog/" + str(worklog_id))
+    params = {"adjustEstimate": "leave"}
+    if payload is None:
+        return jira._session.request(method, url, params=params)
+    return jira._session.request(method, url, params=params, data=json.dumps(payload))
@@ -0,0 +1,498 @@
+import json
+import random
+import re
+import socket
+import threading
+import time
+from base64 import b64decode
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# in-process stand-in for the jira rest api v2, enough for the jira client and the sync scripts
+# it keeps issues and worklogs in memory, adds latency and answers with 429 like the real rate limit
+#
+#   with FakeJiraServer(latency_seconds=0.05) as server:
+#       server.populate(2000, 3, date(2024, 5, 1), date(2024, 5, 31), config.jira_user)
+#       jira = JIRA(server=server.url, basic_auth=(config.jira_user, "token"))
+
+api_path = "/rest/api/2/"
+worklog_list_limit = 1000
+worklog_updated_page_size = 1000
+
+
+def _jira_timestamp(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%S.000%z")
+
+
+class FakeJiraError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class FakeJiraServer:
+    def __init__(
+        self,
+        latency_seconds=0.0,
+        requests_per_second=None,
+        throttle_probability=0.0,
+        deployment_type="Server",
+        account_ids=None,
+        seed=0,
+    ):
+        # every request waits latency_seconds before it is answered
+        self.latency_seconds = latency_seconds
+        # more requests per second than this are answered with 429, None disables the limit
+        self.requests_per_second = requests_per_second
+        # share of requests answered with 429 regardless of the rate
+        self.throttle_probability = throttle_probability
+        # "Cloud" pages searches with a token (search/jql), "Server" with startAt (search)
+        self.deployment_type = deployment_type
+        # email -> accountId of the authenticated users, the email is used if it is missing
+        self.account_ids = account_ids or {}
+        self.random = random.Random(seed)
+
+        self.issues = {}
+        self.issues_by_id = {}
+        self.worklogs = {}
+        # issue id -> {worklog id: worklog}
+        self.worklogs_by_issue = {}
+        # "METHOD path" -> number of requests, path with ids replaced by {id}
+        self.stats = Counter()
+        # guards the data, the random draws, the rate limit and the stats of all handler threads
+        # reentrant, the public add_* methods are also used while the lock is held
+        self.lock = threading.RLock()
+        self._next_issue_id = 10000
+        self._next_worklog_id = 500000
+        self._last_updated = 0
+        self._request_times = []
+        self._httpd = None
+        self._thread = None
+
+    # server
+
+    def start(self):
+        handler = type("FakeJiraHandler", (_Handler,), {"jira": self})
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:" + str(self._httpd.server_address[1])
+
+    # data
+
+    def _author(self, email):
+        return {
+            "accountId": self.account_ids.get(email, email),
+            "emailAddress": email,
+            "displayName": email,
+        }
+
+    def add_issue(self, key, summary=None):
+        with self.lock:
+            issue_id = str(self._next_issue_id)
+            self._next_issue_id += 1
+            issue = {
+                "id": issue_id,
+                "key": key,
+                "self": self._issue_url(issue_id),
+                "fields": {"summary": summary or key},
+            }
+            self.issues[key] = issue
+            self.issues_by_id[issue_id] = issue
+            self.worklogs_by_issue[issue_id] = {}
+            return issue
+
+    def add_worklog(self, key, started, seconds, author_email, comment=""):
+        with self.lock:
+            return self._add_worklog(
+                self._issue(key), started, seconds, author_email, comment
+            )
+
+    # update times in milliseconds, unique so that worklog/updated pages never split a millisecond
+    def _updated_millis(self):
+        self._last_updated = max(int(time.time() * 1000), self._last_updated + 1)
+        return self._last_updated
+
+    def _add_worklog(self, issue, started, seconds, author_email, comment):
+        worklog_id = str(self._next_worklog_id)
+        self._next_worklog_id += 1
+        worklog = {
+            "id": worklog_id,
+            "issueId": issue["id"],
+            "self": self._issue_url(issue["id"]) + "/worklog/" + worklog_id,
+            "author": self._author(author_email),
+            "updateAuthor": self._author(author_email),
+            "comment": comment,
+            "started": started,
+            "timeSpentSeconds": seconds,
+            "timeSpent": str(seconds // 60) + "m",
+            "updated": self._updated_millis(),
+        }
+        self.worklogs[worklog_id] = worklog
+        self.worklogs_by_issue[issue["id"]][worklog_id] = worklog
+        return worklog
+
+    # issues with worklogs_per_issue worklogs each, spread over the days of the range
+    def populate(
+        self,
+        issue_count,
+        worklogs_per_issue,
+        start_date,
+        end_date,
+        author_email,
+        other_authors=("colleague@example.com",),
+        project="EUC",
+    ):
+        days = (end_date - start_date).days + 1
+        with self.lock:
+            for number in range(1, issue_count + 1):
+                key = project + "-" + str(number)
+                self.add_issue(key)
+                for _ in range(worklogs_per_issue):
+                    day = start_date + timedelta(days=self.random.randrange(days))
+                    started = datetime(
+                        day.year,
+                        day.month,
+                        day.day,
+                        9,
+                        tzinfo=timezone(timedelta(hours=1)),
+                    )
+                    author = author_email
+                    if other_authors and self.random.random() < 0.5:
+                        author = self.random.choice(other_authors)
+                    self.add_worklog(
+                        key,
+                        _jira_timestamp(started),
+                        self.random.randint(1, 16) * 900,
+                        author,
+                    )
+
+    def _issue_url(self, issue_id):
+        return self.url + api_path + "issue/" + issue_id
+
+    def _issue(self, key_or_id):
+        issue = self.issues.get(key_or_id) or self.issues_by_id.get(key_or_id)
+        if issue is None:
+            raise FakeJiraError(404, "Issue does not exist: " + key_or_id)
+        return issue
+
+    def _issue_worklogs(self, issue):
+        return list(self.worklogs_by_issue[issue["id"]].values())
+
+    def _worklog(self, issue, worklog_id):
+        worklog = self.worklogs.get(worklog_id)
+        if worklog is None or worklog["issueId"] != issue["id"]:
+            raise FakeJiraError(404, "Worklog does not exist: " + worklog_id)
+        return worklog
+
+    # throttling
+
+    # called with the lock held
+    def _throttled(self):
+        if (
+            self.throttle_probability
+            and self.random.random() < self.throttle_probability
+        ):
+            return True
+        if self.requests_per_second is None:
+            return False
+        now = time.monotonic()
+        self._request_times = [t for t in self._request_times if now - t < 1]
+        if len(self._request_times) >= self.requests_per_second:
+            return True
+        self._request_times.append(now)
+        return False
+
+    # jql, only the queries the sync scripts send are understood
+
+    def _search(self, jql):
+        jql = jql.strip()
+        match = re.fullmatch(r"(id|key)\s+in\s*\(([^)]*)\)", jql, re.IGNORECASE)
+        if match:
+            values = [v.strip().strip("'\"") for v in match.group(2).split(",")]
+            return [
+                self._issue(value)
+                for value in values
+                if value in self.issues or value in self.issues_by_id
+            ]
+
+        conditions = re.split(r"\s+AND\s+", jql, flags=re.IGNORECASE)
+        filters = []
+        for condition in conditions:
+            match = re.fullmatch(
+                r"(worklogDate|worklogAuthor)\s*(>=|<=|=)\s*'?([^']*)'?", condition
+            )
+            if match is None:
+                raise FakeJiraError(400, "Unsupported jql: " + jql)
+            filters.append(match.groups())
+
+        def matches(worklog):
+            for field, operator, value in filters:
+                if field == "worklogAuthor":
+                    author = worklog["author"]
+                    if value not in (author["accountId"], author["emailAddress"]):
+                        return False
+                    continue
+                day = worklog["started"][:10]
+                if (operator == ">=" and day < value) or (
+                    operator == "<=" and day > value
+                ):
+                    return False
+                if operator == "=" and day != value:
+                    return False
+            return True
+
+        issue_ids = {w["issueId"] for w in self.worklogs.values() if matches(w)}
+        return [issue for issue in self.issues.values() if issue["id"] in issue_ids]
+
+    def _search_result(self, issues, fields):
+        if fields in (None, "", "*all", "*navigable"):
+            return issues
+        wanted = fields.split(",")
+        return [
+            {
+                "id": issue["id"],
+                "key": issue["key"],
+                "self": issue["self"],
+                "fields": {
+                    name: value
+                    for name, value in issue["fields"].items()
+                    if name in wanted
+                },
+            }
+            for issue in issues
+        ]
+
+    # routing
+
+    # called with the lock held, the results may be the stored dictionaries themselves
+    def handle(self, method, path, query, body, user):
+        parts = path[len(api_path) :].strip("/").split("/")
+        if method == "GET" and parts == ["serverInfo"]:
+            return {
+                "baseUrl": self.url,
+                "version": "9.12.0",
+                "versionNumbers": [9, 12, 0],
+                "deploymentType": self.deployment_type,
+                "serverTitle": "Fake Jira",
+            }
+        if method == "GET" and parts == ["myself"]:
+            return self._author(user)
+        if method == "GET" and parts == ["field"]:
+            return [
+                {"id": "summary", "name": "Summary", "clauseNames": ["summary"]},
+                {"id": "worklog", "name": "Log Work", "clauseNames": ["worklog"]},
+            ]
+        if parts in (["search"], ["search", "jql"]):
+            params = body if method == "POST" else query
+            return self._handle_search(parts, params)
+        if method == "GET" and parts == ["worklog", "updated"]:
+            return self._handle_worklog_updated(int(query.get("since", 0)))
+        if method == "POST" and parts == ["worklog", "list"]:
+            ids = [str(worklog_id) for worklog_id in body.get("ids", [])]
+            if len(ids) > worklog_list_limit:
+                raise FakeJiraError(400, "At most 1000 worklog ids are allowed")
+            return [self.worklogs[i] for i in ids if i in self.worklogs]
+        if parts[0] == "issue" and len(parts) >= 2:
+            return self._handle_issue(method, parts[1:], query, body, user)
+        raise FakeJiraError(404, "Unknown endpoint " + method + " " + path)
+
+    def _handle_search(self, parts, params):
+        issues = self._search(params.get("jql", ""))
+        max_results = int(params.get("maxResults", 50))
+        fields = params.get("fields")
+        if isinstance(fields, list):
+            fields = ",".join(fields)
+        if parts == ["search", "jql"]:
+            start = int(params.get("nextPageToken") or 0)
+            page = issues[start : start + max_results]
+            result = {
+                "issues": self._search_result(page, fields),
+                "isLast": start + max_results >= len(issues),
+            }
+            if not result["isLast"]:
+                result["nextPageToken"] = str(start + max_results)
+            return result
+        start = int(params.get("startAt", 0))
+        return {
+            "startAt": start,
+            "maxResults": max_results,
+            "total": len(issues),
+            "issues": self._search_result(issues[start : start + max_results], fields),
+        }
+
+    def _handle_worklog_updated(self, since):
+        updated = sorted(
+            (w for w in self.worklogs.values() if w["updated"] >= since),
+            key=lambda w: w["updated"],
+        )
+        page = updated[:worklog_updated_page_size]
+        last_page = len(updated) <= worklog_updated_page_size
+        return {
+            "values": [
+                {"worklogId": int(w["id"]), "updatedTime": w["updated"]} for w in page
+            ],
+            "since": since,
+            # the next page starts after the last returned worklog
+            "until": page[-1]["updated"] + 1 if page else since,
+            "lastPage": last_page,
+        }
+
+    def _handle_issue(self, method, parts, query, body, user):
+        issue = self._issue(parts[0])
+        if len(parts) == 1 and method == "GET":
+            result = dict(issue)
+            result["fields"] = dict(issue["fields"])
+            worklogs = self._issue_worklogs(issue)
+            result["fields"]["worklog"] = {
+                "startAt": 0,
+                "maxResults": 20,
+                "total": len(worklogs),
+                "worklogs": worklogs[:20],
+            }
+            return result
+        if parts[1:] == ["worklog"]:
+            if method == "GET":
+                worklogs = self._issue_worklogs(issue)
+                start = int(query.get("startAt", 0))
+                max_results = int(query.get("maxResults", 5000))
+                return {
+                    "startAt": start,
+                    "maxResults": max_results,
+                    "total": len(worklogs),
+                    "worklogs": worklogs[start : start + max_results],
+                }
+            if method == "POST":
+                with self.lock:
+                    return self._add_worklog(
+                        issue,
+                        body.get(
+                            "started", _jira_timestamp(datetime.now(timezone.utc))
+                        ),
+                        int(body["timeSpentSeconds"]),
+                        user,
+                        body.get("comment", ""),
+                    )
+        if len(parts) == 3 and parts[1] == "worklog":
+            with self.lock:
+                worklog = self._worklog(issue, parts[2])
+                if method == "GET":
+                    return worklog
+                if method == "PUT":
+                    for field in ("timeSpentSeconds", "comment", "started"):
+                        if field in body:
+                            worklog[field] = body[field]
+                    worklog["timeSpent"] = str(worklog["timeSpentSeconds"] // 60) + "m"
+                    worklog["updated"] = self._updated_millis()
+                    return worklog
+                if method == "DELETE":
+                    del self.worklogs[worklog["id"]]
+                    del self.worklogs_by_issue[issue["id"]][worklog["id"]]
+                    return None
+        raise FakeJiraError(404, "Unknown issue endpoint " + "/".join(parts))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    jira = None
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # headers and body are written separately, without this delayed acks add 40ms per request
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _user(self):
+        authorization = self.headers.get("Authorization", "")
+        if authorization.startswith("Basic "):
+            return b64decode(authorization[6:]).decode("utf-8").split(":", 1)[0]
+        return "anonymous"
+
+    def _send(self, status, payload, headers=None):
+        self._send_data(status, json.dumps(payload).encode("utf-8"), headers)
+
+    def _send_data(self, status, data, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        endpoint = re.sub(
+            r"/\d+(?=/|$)|/[A-Z][A-Z0-9]*-\d+", "/{id}", url.path[len(api_path) - 1 :]
+        )
+        with self.jira.lock:
+            self.jira.stats[method + " " + endpoint] += 1
+
+        if self.jira.latency_seconds:
+            time.sleep(self.jira.latency_seconds)
+        with self.jira.lock:
+            throttled = self.jira._throttled()
+            if throttled:
+                self.jira.stats["429"] += 1
+        if throttled:
+            self._send(
+                429,
+                {"errorMessages": ["Rate limit exceeded"]},
+                {"Retry-After": "1"},
+            )
+            return
+
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+            if not url.path.startswith(api_path):
+                raise FakeJiraError(404, "Unknown path " + url.path)
+            with self.jira.lock:
+                result = self.jira.handle(method, url.path, query, body, self._user())
+                # encoded before other requests can change the stored worklogs
+                data = None if result is None else json.dumps(result).encode("utf-8")
+        except FakeJiraError as e:
+            self._send(e.status, {"errorMessages": [str(e)], "errors": {}})
+            return
+        if data is None:
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        created = method == "POST" and url.path.endswith("/worklog")
+        self._send_data(201 if created else 200, data)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
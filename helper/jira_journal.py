@@ -0,0 +1,126 @@
+try:
+    from . import config
+except ImportError:
+    import config
+
+import json
+import logging
+import os
+import sqlite3
+from datetime import datetime, timezone
+from hashlib import sha1
+
+try:
+    from .toggl_cache import cache_dir
+except ImportError:
+    from toggl_cache import cache_dir
+
+journal_file = getattr(
+    config, "jira_sync_journal", os.path.join(cache_dir, "jira_sync_journal.sqlite")
+)
+
+
+# fingerprint of everything a jira worklog is written from, entries and their merged values
+def cell_hash(ticket_aggregates):
+    entry_ids = sorted(
+        entry_id for aggregate in ticket_aggregates for entry_id in aggregate.entry_ids
+    )
+    seconds = sum(aggregate.seconds for aggregate in ticket_aggregates)
+    description = ", ".join(aggregate.description for aggregate in ticket_aggregates)
+    return sha1(
+        json.dumps([entry_ids, seconds, description]).encode("utf-8")
+    ).hexdigest()
+
+
+# remembers which toggl entries were synced into which jira worklog, so a rerun only
+# looks at the (ticket, date) cells whose toggl entries changed since
+class JiraSyncJournal:
+    def __init__(self, path=None):
+        self.path = path or journal_file
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS synced_cells ("
+            "ticket TEXT NOT NULL, date TEXT NOT NULL, hash TEXT NOT NULL, "
+            "entry_ids TEXT NOT NULL, seconds INTEGER NOT NULL, worklog_id TEXT, "
+            "synced_at TEXT NOT NULL, PRIMARY KEY (ticket, date))"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS journal_state (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        row = self.db.execute(
+            "SELECT value FROM journal_state WHERE key = 'account'"
+        ).fetchone()
+        if row is None or row[0] != config.jira_user:
+            # worklogs of another jira account say nothing about this one
+            self.reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def reset(self):
+        logging.info("resetting jira sync journal")
+        self.db.execute("DELETE FROM synced_cells")
+        self.db.execute(
+            "INSERT OR REPLACE INTO journal_state (key, value) VALUES ('account', ?)",
+            (config.jira_user,),
+        )
+        self.db.commit()
+
+    # returns (changed, removed): cells of the aggregates that are new or differ from their
+    # last sync, and journaled cells in the range that have no toggl entries anymore
+    # the range excludes end_date like the toggl range of the aggregates
+    # with dates, the aggregates only cover these days and the other days are left alone
+    def changed_cells(self, aggregates, start_date, end_date, dates=None):
+        synced = {
+            (ticket, date): cell
+            for ticket, date, cell in self.db.execute(
+                "SELECT ticket, date, hash FROM synced_cells "
+                "WHERE date >= ? AND date < ?",
+                (str(start_date), str(end_date)),
+            )
+            if dates is None or date in dates
+        }
+        changed = {
+            key
+            for key, ticket_aggregates in aggregates.tickets.items()
+            if synced.get(key) != cell_hash(ticket_aggregates)
+        }
+        removed = set(synced) - set(aggregates.tickets)
+        return (changed, removed)
+
+    def record(self, aggregates, ticket, date, worklog_id):
+        ticket_aggregates = aggregates.tickets[(ticket, date)]
+        self.db.execute(
+            "INSERT OR REPLACE INTO synced_cells "
+            "(ticket, date, hash, entry_ids, seconds, worklog_id, synced_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                ticket,
+                date,
+                cell_hash(ticket_aggregates),
+                json.dumps(
+                    sorted(
+                        entry_id
+                        for aggregate in ticket_aggregates
+                        for entry_id in aggregate.entry_ids
+                    )
+                ),
+                sum(aggregate.seconds for aggregate in ticket_aggregates),
+                None if worklog_id is None else str(worklog_id),
+                datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
+            ),
+        )
+        self.db.commit()
+
+    def forget(self, ticket, date):
+        self.db.execute(
+            "DELETE FROM synced_cells WHERE ticket = ? AND date = ?", (ticket, date)
+        )
+        self.db.commit()
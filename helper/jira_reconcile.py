@@ -0,0 +1,304 @@
+try:
+    from . import config
+except ImportError:
+    import config
+
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    from .jira_client import max_workers, send_worklog_request
+except ImportError:
+    from jira_client import max_workers, send_worklog_request
+
+# jira keeps minutes, differences below the tolerance are not worth a rewrite
+tolerance_seconds = getattr(config, "jira_sync_tolerance_seconds", 60)
+# what happens with worklogs that differ from toggl or are missing in toggl:
+# "auto" replaces/deletes them, "skip" only adds missing worklogs, "ask" asks once per change
+# before anything is written
+default_policy = getattr(config, "jira_sync_policy", "ask")
+# worklogs without toggl entries are only planned for deletion on request, they may be booked
+# by other tools
+delete_missing = getattr(config, "jira_sync_delete_missing", False)
+
+actions = ("add", "replace", "delete", "unchanged")
+
+
+# one ticket on one day, compared between toggl and jira
+class PlannedChange:
+    __slots__ = (
+        "action",
+        "ticket",
+        "date",
+        "toggl_seconds",
+        "jira_seconds",
+        "comment",
+        "worklog_ids",
+    )
+
+    def __init__(
+        self,
+        action,
+        ticket,
+        date,
+        toggl_seconds,
+        jira_seconds,
+        comment,
+        worklog_ids=None,
+    ):
+        self.action = action
+        self.ticket = ticket
+        self.date = date
+        self.toggl_seconds = toggl_seconds
+        self.jira_seconds = jira_seconds
+        self.comment = comment
+        # ids of the existing own worklogs, None if they are unknown
+        self.worklog_ids = worklog_ids
+
+    def __str__(self):
+        toggl = "-" if self.toggl_seconds is None else str(self.toggl_seconds / 3600)
+        jira = "-" if self.jira_seconds is None else str(self.jira_seconds / 3600)
+        return (
+            f"{self.action:<9} {self.date} {self.ticket:<12} "
+            f"toggl: {toggl}h, Jira: {jira}h"
+        )
+
+
+# compares the toggl aggregates with the jira worklog map {date: {ticket: hours}}
+# and returns one PlannedChange per ticket and day of toggl (and of jira if delete is set)
+# worklog_ids {date: {ticket: [worklog id, ...]}} are attached to the changes
+# cells limits the plan to these (ticket, date) pairs
+# deletes are only planned for days of the toggl range [start_date, end_date), jira is asked
+# including the end date and its worklogs there have toggl entries that were not fetched
+def build_plan(
+    aggregates,
+    jira_worklog_list,
+    tolerance=None,
+    delete=None,
+    worklog_ids=None,
+    cells=None,
+    start_date=None,
+    end_date=None,
+):
+    if tolerance is None:
+        tolerance = tolerance_seconds
+    if delete is None:
+        delete = delete_missing
+    if worklog_ids is None:
+        worklog_ids = {}
+    if delete and (start_date is None or end_date is None):
+        logging.warning("no toggl range given, worklogs missing in toggl are kept")
+        delete = False
+    plan = []
+    seen = set()
+    for ticket, date, seconds, description in aggregates.ticket_cells():
+        seen.add((date, ticket))
+        if cells is not None and (ticket, date) not in cells:
+            continue
+        hours_jira = jira_worklog_list.get(date, {}).get(ticket)
+        if hours_jira is None:
+            action, jira_seconds = "add", None
+        else:
+            jira_seconds = round(hours_jira * 3600)
+            if abs(jira_seconds - seconds) <= tolerance:
+                action = "unchanged"
+            else:
+                action = "replace"
+        plan.append(
+            PlannedChange(
+                action,
+                ticket,
+                date,
+                seconds,
+                jira_seconds,
+                description,
+                worklog_ids.get(date, {}).get(ticket),
+            )
+        )
+
+    # booked in jira, but not (anymore) in toggl
+    for date, tickets in jira_worklog_list.items() if delete else ():
+        for ticket, hours_jira in tickets.items():
+            if (
+                (date, ticket) not in seen
+                and str(start_date) <= date < str(end_date)
+                and (cells is None or (ticket, date) in cells)
+            ):
+                plan.append(
+                    PlannedChange(
+                        "delete",
+                        ticket,
+                        date,
+                        None,
+                        round(hours_jira * 3600),
+                        None,
+                        worklog_ids.get(date, {}).get(ticket),
+                    )
+                )
+    plan.sort(key=lambda change: (change.date, change.ticket))
+    return plan
+
+
+def log_plan(plan):
+    for change in plan:
+        if change.action != "unchanged":
+            logging.info(str(change))
+    counts = Counter(change.action for change in plan)
+    logging.info(
+        "jira sync plan: "
+        + ", ".join(action + "=" + str(counts[action]) for action in actions)
+    )
+
+
+# the changes that may be written under the policy, all questions are asked up front
+def approve_plan(plan, policy=None):
+    if policy is None:
+        policy = default_policy
+    if policy not in ("auto", "skip", "ask"):
+        raise Exception("Unknown jira sync policy '" + str(policy) + "'")
+
+    approved = []
+    for change in plan:
+        if change.action == "unchanged":
+            continue
+        if change.action == "add" or policy == "auto":
+            approved.append(change)
+        elif policy == "ask":
+            if change.action == "replace":
+                question = "Should the Jira worklog be updated to the Toggl time? Duplicate worklogs of the day will be deleted. (y/n): "
+            else:
+                question = "The entry is missing in toggl. Should it be deleted in Jira? (y/n): "
+            logging.info(str(change))
+            if input(question) == "y":
+                approved.append(change)
+    return approved
+
+
+def _is_own_worklog(worklog):
+    author = worklog.author
+    return (
+        getattr(author, "accountId", None) == config.jira_account_id
+        or getattr(author, "emailAddress", None) == config.jira_user
+    )
+
+
+def delete_worklogs_for_ticket_and_date(jira, ticket, date_to_delete):
+    for worklog in jira.worklogs(ticket):
+        if worklog.started[:10] == date_to_delete and _is_own_worklog(worklog):
+            worklog.delete(adjustEstimate="leave")
+            logging.info(
+                "Delete         entry on "
+                + worklog.started[:10]
+                + " with "
+                + str(worklog.timeSpentSeconds / 3600)
+                + "h for "
+                + ticket
+            )
+
+
+def add_worklog(jira, change):
+    logging.info(
+        "Adding missing entry on "
+        + change.date
+        + " with "
+        + str(change.toggl_seconds / 3600)
+        + "h for "
+        + change.ticket
+    )
+    # date to datetime with timezone
+    datetime_with_zone = datetime.strptime(
+        change.date + "T00:00:00.000+0100", "%Y-%m-%dT%H:%M:%S.000%z"
+    )
+    return jira.add_worklog(
+        change.ticket,
+        timeSpentSeconds=change.toggl_seconds,
+        started=datetime_with_zone,
+        comment=change.comment,
+    ).id
+
+
+def update_worklog(jira, change, worklog_id):
+    logging.info(
+        "Update         entry on "
+        + change.date
+        + " with "
+        + str(change.toggl_seconds / 3600)
+        + "h for "
+        + change.ticket
+    )
+    send_worklog_request(
+        jira,
+        "PUT",
+        change.ticket,
+        worklog_id,
+        {"timeSpentSeconds": change.toggl_seconds, "comment": change.comment},
+    )
+    return worklog_id
+
+
+def delete_worklog(jira, change, worklog_id):
+    logging.info(
+        "Delete         entry on "
+        + change.date
+        + " "
+        + str(worklog_id)
+        + " for "
+        + change.ticket
+    )
+    send_worklog_request(jira, "DELETE", change.ticket, worklog_id)
+
+
+# returns the id of the worklog that holds the toggl time afterwards, None after deletes
+def _execute_change(jira, change):
+    if change.action == "add":
+        return add_worklog(jira, change)
+    if change.worklog_ids is None:
+        # worklogs unknown, delete whatever is booked on that date and add it again
+        delete_worklogs_for_ticket_and_date(jira, change.ticket, change.date)
+        if change.action == "replace":
+            return add_worklog(jira, change)
+        return None
+    if change.action == "replace":
+        # the first worklog of the day is updated in place, only duplicates are deleted
+        for worklog_id in change.worklog_ids[1:]:
+            delete_worklog(jira, change, worklog_id)
+        return update_worklog(jira, change, change.worklog_ids[0])
+    for worklog_id in change.worklog_ids:
+        delete_worklog(jira, change, worklog_id)
+    return None
+
+
+# writes the approved changes with up to max_workers changes in flight
+# every change touches a different ticket and day, so they do not depend on each other
+# returns [(change, worklog id)] of the written changes, on_written is called for each of them
+# in the calling thread, also when other changes failed
+def execute_plan(jira, changes, dry_run=False, on_written=None):
+    if dry_run:
+        for change in changes:
+            logging.info("dry run, not written: " + str(change))
+        return []
+
+    def execute(change):
+        try:
+            return (change, _execute_change(jira, change), None)
+        except Exception as e:
+            logging.error("Failed to " + str(change) + ": " + str(e))
+            return (change, None, e)
+
+    written = []
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for change, worklog_id, error in executor.map(execute, changes):
+            if error is not None:
+                failed.append(change)
+                continue
+            written.append((change, worklog_id))
+            if on_written is not None:
+                on_written(change, worklog_id)
+    if failed:
+        raise Exception(
+            str(len(failed)) + " of " + str(len(changes)) + " jira changes failed"
+        )
+    return written
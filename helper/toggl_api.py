@@ -0,0 +1,352 @@
+try:
+    from . import config
+except ImportError:
+    import config
+
+import logging
+import re
+import threading
+import time
+from base64 import b64encode
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from .fixtures import fixtures_active, recorded
+    from .toggl_cache import load_toggl_metadata, store_toggl_metadata
+    from .toggl_store import TogglEntryStore, as_date, sync_time_entries
+except ImportError:
+    from fixtures import fixtures_active, recorded
+    from toggl_cache import load_toggl_metadata, store_toggl_metadata
+    from toggl_store import TogglEntryStore, as_date, sync_time_entries
+
+toggl_api_url = "https://api.track.toggl.com/api/v9"
+request_timeout_seconds = 60
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_toggl_headers():
+    api_auth = b64encode(bytes(config.toggl_api_token + ":api_token", "ascii")).decode(
+        "ascii"
+    )
+    # apiAUth = b64encode(bytes(config.toggl_cred + ":api_token", 'ascii')).decode("ascii") # alternative to api_token
+    return {"Authorization": "Basic %s" % api_auth}
+
+
+# one keep-alive session for all toggl requests, so the TLS handshake is only paid once
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(_get_toggl_headers())
+            _session.mount("https://", HTTPAdapter(pool_maxsize=8))
+        return _session
+
+
+# toggl allows about one request per second per token on top of the hourly quota
+requests_per_second = getattr(config, "toggl_requests_per_second", 1.0)
+request_burst = getattr(config, "toggl_request_burst", 3)
+# longer quota resets are not waited for, the run is aborted instead
+max_quota_wait_seconds = getattr(config, "toggl_max_quota_wait_seconds", 3600)
+max_retries = 5
+
+
+# token bucket that also knows the remaining hourly quota from the response headers
+class TogglRateLimiter:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+        self.quota_remaining = None
+        self.quota_reset_at = None
+        # the reset the waiting callers were warned about, one warning per reset
+        self.quota_warned_reset_at = None
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if (
+                    self.quota_remaining == 0
+                    and self.quota_reset_at is not None
+                    and now < self.quota_reset_at
+                ):
+                    wait = self.quota_reset_at - now
+                    # the same limit as for 402 responses, long resets abort the run
+                    if wait > max_quota_wait_seconds:
+                        _raise_for_quota(int(wait))
+                    if self.quota_warned_reset_at != self.quota_reset_at:
+                        self.quota_warned_reset_at = self.quota_reset_at
+                        logging.warning(
+                            f"Toggl quota used up, waiting {wait:.0f}s for the quota reset"
+                        )
+                else:
+                    self.tokens = min(
+                        self.burst, self.tokens + (now - self.last_refill) * self.rate
+                    )
+                    self.last_refill = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        if self.quota_remaining is not None:
+                            self.quota_remaining -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def update(self, response):
+        remaining = response.headers.get("X-Toggl-Quota-Remaining")
+        resets_in = response.headers.get("X-Toggl-Quota-Resets-In")
+        with self.lock:
+            if remaining is not None and remaining.isdigit():
+                self.quota_remaining = int(remaining)
+            if resets_in is not None and resets_in.isdigit():
+                self.quota_reset_at = time.monotonic() + int(resets_in)
+
+    def block_until(self, seconds):
+        with self.lock:
+            self.quota_remaining = 0
+            self.quota_reset_at = time.monotonic() + seconds
+            # the 402 response was already logged with its wait
+            self.quota_warned_reset_at = self.quota_reset_at
+
+
+rate_limiter = TogglRateLimiter(requests_per_second, request_burst)
+
+
+def _quota_reset_seconds(response):
+    resets_in = response.headers.get("X-Toggl-Quota-Resets-In")
+    if resets_in is not None and resets_in.isdigit():
+        return int(resets_in)
+    # Extract remaining seconds from response text
+    match = re.search(r"reset in (\d+) seconds", response.text)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def _raise_for_quota(remaining_seconds):
+    if remaining_seconds is not None:
+        minutes, seconds = divmod(remaining_seconds, 60)
+        time_str = f"{minutes}m {seconds}s"
+    else:
+        time_str = "unknown"
+
+    logging.error(
+        f"Quota reached: HTTP 402. Please wait before making further requests. Quota resets in {time_str}."
+    )
+    raise Exception(
+        f"Quota reached: HTTP 402. Please wait before making further requests. Quota resets in {time_str}."
+    )
+
+
+def toggl_get(path, params=None):
+    key = path + "?" + urlencode(sorted((params or {}).items()))
+    return recorded("toggl", key, lambda: _toggl_get(path, params))
+
+
+def _toggl_get(path, params):
+    for attempt in range(max_retries + 1):
+        rate_limiter.acquire()
+        response = get_session().get(
+            toggl_api_url + path, params=params, timeout=request_timeout_seconds
+        )
+        rate_limiter.update(response)
+
+        if response.status_code == 402:
+            remaining_seconds = _quota_reset_seconds(response)
+            if (
+                remaining_seconds is None
+                or remaining_seconds > max_quota_wait_seconds
+                or attempt == max_retries
+            ):
+                _raise_for_quota(remaining_seconds)
+            logging.warning(
+                f"Quota reached: HTTP 402. Waiting {remaining_seconds}s for the quota reset before retrying {path}"
+            )
+            # wait one second longer, toggl rounds the reset time down
+            rate_limiter.block_until(remaining_seconds + 1)
+            continue
+        if response.status_code == 429 and attempt < max_retries:
+            # too many requests per second, back off exponentially
+            retry_after = response.headers.get("Retry-After", "")
+            wait = int(retry_after) if retry_after.isdigit() else 2**attempt
+            logging.warning(f"HTTP 429 from toggl, retrying {path} in {wait}s")
+            time.sleep(wait)
+            continue
+        break
+
+    if response.status_code != 200:
+        logging.error("Error: " + str(response.status_code) + " " + response.reason)
+        raise Exception("Errortext: " + str(response.text))
+    return response.json()
+
+
+def request_clients():
+    client_list = {}
+    for client in toggl_get("/me/clients"):
+        if client_list.get(client["id"]) is None:
+            client_list[client["id"]] = client["name"]
+    return client_list
+
+
+def request_projects():
+    project_list = {}
+    for project in toggl_get("/me/projects"):
+        if project_list.get(project["id"]) is None:
+            project_list[project["id"]] = {
+                "name": project["name"],
+                "client_id": project["client_id"],
+            }
+    return project_list
+
+
+# params is either start_date/end_date or since (unix timestamp, includes deleted entries)
+def request_time_entries(params):
+    return toggl_get("/me/time_entries", params)
+
+
+# splits [start_date, end_date) into calendar weeks or months
+def split_date_range(start_date, end_date, window="month"):
+    windows = []
+    current, end_date = as_date(start_date), as_date(end_date)
+    while current < end_date:
+        if window == "week":
+            next_start = current + timedelta(days=7 - current.weekday())
+        elif window == "month":
+            next_start = (current.replace(day=1) + timedelta(days=32)).replace(day=1)
+        else:
+            raise ValueError("window must be 'week' or 'month', not " + str(window))
+        windows.append((current, min(next_start, end_date)))
+        current = next_start
+    return windows
+
+
+# fetches the range window by window with at most max_workers requests in flight
+# entries are yielded newest window first, the same order toggl uses within one response
+def iter_time_entries(start_date, end_date, window="month", max_workers=3):
+    windows = iter(split_date_range(start_date, end_date, window)[::-1])
+
+    def fetch_window(window_range):
+        logging.debug("fetch toggl window " + str(window_range))
+        return request_time_entries(
+            {"start_date": str(window_range[0]), "end_date": str(window_range[1])}
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque(
+            executor.submit(fetch_window, window_range)
+            for window_range in islice(windows, max_workers)
+        )
+        while pending:
+            time_entries = pending.popleft().result()
+            window_range = next(windows, None)
+            if window_range is not None:
+                pending.append(executor.submit(fetch_window, window_range))
+            yield from time_entries
+
+
+def _request_range(start_date, end_date, window):
+    if window is None:
+        return request_time_entries(
+            {"start_date": str(start_date), "end_date": str(end_date)}
+        )
+    return iter_time_entries(start_date, end_date, window)
+
+
+def _load_time_entries(start_date, end_date, use_store, window=None):
+    if not use_store:
+        return _request_range(start_date, end_date, window)
+    # the store is opened in the worker thread, sqlite connections are bound to their thread
+    with TogglEntryStore() as store:
+        return sync_time_entries(
+            store,
+            start_date,
+            end_date,
+            lambda start, end: list(_request_range(start, end, window)),
+            lambda since: request_time_entries({"since": since}),
+        )
+
+
+# brings the local entry store up to date and returns (changed, time_entries): the entries toggl
+# reported as changed since the last sync plus their previously stored versions, and all stored
+# entries of the range. changed is None if (part of) the range had to be downloaded completely
+def fetch_toggl_changes(start_date, end_date):
+    changed = []
+    downloaded = False
+
+    def fetch_range(start, end):
+        nonlocal downloaded
+        downloaded = True
+        return list(_request_range(start, end, None))
+
+    def fetch_since(since):
+        time_entries = request_time_entries({"since": since})
+        # the stored versions tell on which days moved or deleted entries were before
+        changed.extend(time_entries)
+        changed.extend(store.read_entries([entry["id"] for entry in time_entries]))
+        return time_entries
+
+    with TogglEntryStore() as store:
+        time_entries = sync_time_entries(
+            store, start_date, end_date, fetch_range, fetch_since
+        )
+    return (None if downloaded else changed, time_entries)
+
+
+# returns the client and project lookup tables, from the disk cache if it is still valid
+def get_toggl_metadata(refresh=False):
+    if not refresh and not fixtures_active():
+        cached = load_toggl_metadata()
+        if cached is not None:
+            return cached
+
+    logging.info("request toggl clients and projects")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        clients_future = executor.submit(request_clients)
+        projects_future = executor.submit(request_projects)
+        client_list, project_list = clients_future.result(), projects_future.result()
+
+    # fixture data must not replace the cache of the real account
+    if not fixtures_active():
+        store_toggl_metadata(client_list, project_list)
+    return (client_list, project_list)
+
+
+# fetches clients, projects and time entries in parallel over the shared session
+# returns (client_list, project_list, time_entries), time_entries is a generator if a window
+# is given and the local store is not used
+def fetch_toggl_data(start_date, end_date, use_store=True, window=None):
+    cached = None
+    if fixtures_active():
+        # recordings must contain every request, the local caches would hide some of them
+        use_store = False
+    else:
+        cached = load_toggl_metadata()
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        entries_future = executor.submit(
+            _load_time_entries, start_date, end_date, use_store, window
+        )
+        if cached is None:
+            logging.info("request toggl clients and projects")
+            clients_future = executor.submit(request_clients)
+            projects_future = executor.submit(request_projects)
+            client_list = clients_future.result()
+            project_list = projects_future.result()
+            if not fixtures_active():
+                store_toggl_metadata(client_list, project_list)
+        else:
+            client_list, project_list = cached
+        time_entries = entries_future.result()
+
+    return (client_list, project_list, time_entries)
@@ -0,0 +1,87 @@
+try:
+    from . import config
+except ImportError:
+    import config
+
+import json
+import logging
+import os
+import time
+from hashlib import sha256
+
+# cache lives next to the helper scripts unless configured otherwise
+cache_dir = getattr(
+    config,
+    "toggl_cache_dir",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"),
+)
+# clients and projects change rarely, half a day is a good compromise
+metadata_ttl_seconds = getattr(config, "toggl_metadata_ttl_seconds", 12 * 3600)
+
+
+def _metadata_cache_file():
+    return os.path.join(cache_dir, "toggl_metadata.json")
+
+
+def token_fingerprint():
+    # the cache must not be shared between different toggl accounts
+    return sha256(config.toggl_api_token.encode("utf-8")).hexdigest()[:16]
+
+
+# returns (client_list, project_list) from the disk cache or None if it is missing, expired or for another account
+def load_toggl_metadata(ttl_seconds=None):
+    if ttl_seconds is None:
+        ttl_seconds = metadata_ttl_seconds
+    try:
+        with open(_metadata_cache_file(), "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if cache.get("account") != token_fingerprint():
+        logging.debug("toggl metadata cache belongs to another account")
+        return None
+    age = time.time() - cache.get("fetched_at", 0)
+    if age > ttl_seconds:
+        logging.debug("toggl metadata cache expired " + str(int(age)) + "s ago")
+        return None
+
+    # json only knows string keys, toggl ids are integers
+    client_list = {int(k): v for k, v in cache["clients"].items()}
+    project_list = {int(k): v for k, v in cache["projects"].items()}
+    logging.debug("toggl metadata loaded from cache (" + str(int(age)) + "s old)")
+    return (client_list, project_list)
+
+
+def store_toggl_metadata(client_list, project_list):
+    os.makedirs(cache_dir, exist_ok=True)
+    cache = {
+        "account": token_fingerprint(),
+        "fetched_at": time.time(),
+        "clients": client_list,
+        "projects": project_list,
+    }
+    # write to a temp file first so a parallel run never reads a half written cache
+    tmp_file = _metadata_cache_file() + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp_file, _metadata_cache_file())
+
+
+def invalidate_toggl_metadata():
+    try:
+        os.remove(_metadata_cache_file())
+        logging.info("toggl metadata cache invalidated")
+    except FileNotFoundError:
+        pass
+
+
+# the scripts accept this flag to drop the cached clients and projects before they run
+refresh_flag = "--refresh-toggl-metadata"
+
+
+# for the scripts that read sys.argv themselves, the flag is removed from argv
+def handle_refresh_flag(argv):
+    if refresh_flag in argv:
+        argv.remove(refresh_flag)
+        invalidate_toggl_metadata()
@@ -0,0 +1,211 @@
+from datetime import date, datetime, timedelta, timezone
+
+try:
+    import numpy as np
+except ImportError:  # only needed for the columnar engine
+    np = None
+
+try:
+    from .toggl_model import berlin
+    from .toggl_rules import ClassificationRules
+except ImportError:
+    from toggl_model import berlin
+    from toggl_rules import ClassificationRules
+
+
+# integer codes in order of first occurrence, plus the first row of every code
+def _factorize(values):
+    _, first, inverse = np.unique(values, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[inverse], first[order]
+
+
+def _combine(codes_a, codes_b):
+    return _factorize(codes_a.astype(np.int64) * (int(codes_b.max()) + 1) + codes_b)
+
+
+# rows of every group in their original order
+def _group_rows(codes, group_count):
+    order = np.argsort(codes, kind="stable")
+    bounds = np.cumsum(np.bincount(codes, minlength=group_count))
+    return np.split(order, bounds[:-1])
+
+
+def _to_epoch(timestamps):
+    # toggl sends utc timestamps, everything else is converted one by one
+    utc = [
+        timestamp[:19]
+        if timestamp[19:] in ("Z", "+00:00")
+        else datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+        .astimezone(timezone.utc)
+        .strftime("%Y-%m-%dT%H:%M:%S")
+        for timestamp in timestamps
+    ]
+    return np.array(utc, dtype="datetime64[s]").astype(np.int64)
+
+
+def _berlin_offsets(epochs):
+    # the offset only changes on full hours, so it is resolved once per distinct hour
+    hours, inverse = np.unique(epochs // 3600, return_inverse=True)
+    offsets = np.array(
+        [
+            datetime.fromtimestamp(int(hour) * 3600, berlin).utcoffset().total_seconds()
+            for hour in hours
+        ],
+        dtype=np.int64,
+    )
+    return offsets[inverse]
+
+
+def _code_strings(values):
+    codes = {}
+    return np.array([codes.setdefault(v, len(codes)) for v in values]), list(codes)
+
+
+# columnar alternative to toggl_model.build_aggregates(...).to_legacy() for large exports
+# produces the same (time_entry_list, workingtime_by_day_list, time_entry_list_detail),
+# hours are summed as whole seconds and may differ in the last floating point digit
+def aggregate_time_entries_columnar(
+    time_entries, client_list, project_list, rules=None
+):
+    if np is None:
+        raise ImportError("numpy is required for the columnar aggregation engine")
+    if rules is None:
+        rules = ClassificationRules()
+
+    # skip entries with negative duration -> current running entries
+    time_entries = [
+        time_entry for time_entry in time_entries if time_entry["duration"] >= 0
+    ]
+    classes = {}
+    class_codes = np.empty(len(time_entries), dtype=np.int64)
+    for row, time_entry in enumerate(time_entries):
+        key = (time_entry["project_id"], time_entry["description"])
+        class_code = classes.get(key)
+        if class_code is None:
+            class_code = classes[key] = len(classes)
+        class_codes[row] = class_code
+    class_counts = np.bincount(class_codes, minlength=len(classes))
+    class_list = [
+        rules.classify(project_id, description, client_list, project_list, int(count))
+        for (project_id, description), count in zip(classes, class_counts)
+    ]
+    rules.log_hits()
+
+    keep = np.array([c is not None for c in class_list], dtype=bool)[class_codes]
+    rows = np.flatnonzero(keep)
+    time_entries = [time_entries[row] for row in rows]
+    class_codes = class_codes[rows]
+    if not time_entries:
+        return ({}, {}, {})
+
+    durations = np.array([e["duration"] for e in time_entries], dtype=np.int64)
+    starts = _to_epoch([e["start"] for e in time_entries])
+    stops = _to_epoch([e["stop"] for e in time_entries])
+    start_days = (starts + _berlin_offsets(starts)) // 86400
+    stop_days = (stops + _berlin_offsets(stops)) // 86400
+    crosses_midnight = stop_days != start_days
+
+    project_codes, projects = _code_strings(class_list[c][0] for c in class_codes)
+    day_codes, first_day_rows = _factorize(start_days)
+    dates = [
+        str(date(1970, 1, 1) + timedelta(days=int(start_days[row])))
+        for row in first_day_rows
+    ]
+    descriptions = [e["description"] for e in time_entries]
+
+    time_entry_list = {}
+    time_entry_list_detail = {}
+
+    # hours and descriptions per project and day
+    project_day_codes, first_rows = _combine(project_codes, day_codes)
+    project_day_seconds = np.bincount(project_day_codes, weights=durations)
+    project_day_rows = _group_rows(project_day_codes, len(first_rows))
+    for group, first_row in enumerate(first_rows):
+        project = projects[project_codes[first_row]]
+        day = dates[day_codes[first_row]]
+        time_entry_list.setdefault(project, {})[day] = {
+            "hours": float(project_day_seconds[group]) / 3600,
+            "description": ", ".join(
+                descriptions[row] for row in project_day_rows[group]
+            ),
+        }
+        time_entry_list_detail.setdefault(project, {})[day] = {}
+
+    # working time per day, the latest entry crossing midnight wins like in the loop
+    day_count = len(first_day_rows)
+    day_seconds = np.bincount(day_codes, weights=durations, minlength=day_count)
+    day_start = np.full(day_count, np.iinfo(np.int64).max)
+    np.minimum.at(day_start, day_codes, starts)
+    day_end = np.full(day_count, np.iinfo(np.int64).min)
+    np.maximum.at(day_end, day_codes, stops)
+    last_crossing_row = np.full(day_count, -1)
+    crossing_rows = np.flatnonzero(crosses_midnight)
+    np.maximum.at(last_crossing_row, day_codes[crossing_rows], crossing_rows)
+
+    workingtime_by_day_list = {}
+    for day_code, day in enumerate(dates):
+        if last_crossing_row[day_code] >= 0:
+            endtime = datetime.fromtimestamp(
+                int(stops[last_crossing_row[day_code]]), berlin
+            ).replace(hour=0, minute=0)
+        else:
+            endtime = datetime.fromtimestamp(int(day_end[day_code]), berlin)
+        workingtime_by_day_list[day] = {
+            "hours": float(day_seconds[day_code]) / 3600,
+            "starttime": datetime.fromtimestamp(int(day_start[day_code]), berlin),
+            "endtime": endtime,
+        }
+
+    # Eucon Jira Logic - hours, descriptions and detail list per ticket
+    ticket_rows = np.flatnonzero(
+        np.array([class_list[c][1] is not None for c in class_codes], dtype=bool)
+    )
+    if len(ticket_rows) == 0:
+        return (time_entry_list, workingtime_by_day_list, time_entry_list_detail)
+    ticket_codes, tickets = _code_strings(
+        class_list[class_codes[row]][1] for row in ticket_rows
+    )
+    ticket_group_codes, ticket_first = _combine(
+        project_day_codes[ticket_rows], ticket_codes
+    )
+    ticket_seconds = np.bincount(ticket_group_codes, weights=durations[ticket_rows])
+    for group, first in enumerate(ticket_first):
+        row = ticket_rows[first]
+        project = projects[project_codes[row]]
+        day = dates[day_codes[row]]
+        time_entry_list[project][day][tickets[ticket_codes[first]]] = {
+            "hours": float(ticket_seconds[group]) / 3600,
+            "description": None,
+        }
+        time_entry_list_detail[project][day][tickets[ticket_codes[first]]] = {}
+
+    ticket_descriptions = [class_list[class_codes[row]][2] for row in ticket_rows]
+    for group, group_rows in enumerate(
+        _group_rows(ticket_group_codes, len(ticket_first))
+    ):
+        joined = None
+        for row in group_rows:
+            description = ticket_descriptions[row]
+            if joined is None:
+                joined = description
+            elif description not in joined:
+                joined += ", " + description
+        row = ticket_rows[ticket_first[group]]
+        ticket = tickets[ticket_codes[ticket_first[group]]]
+        time_entry_list[projects[project_codes[row]]][dates[day_codes[row]]][ticket][
+            "description"
+        ] = joined
+
+    description_codes, _ = _code_strings(ticket_descriptions)
+    detail_codes, detail_first = _combine(ticket_group_codes, description_codes)
+    detail_seconds = np.bincount(detail_codes, weights=durations[ticket_rows])
+    for group, first in enumerate(detail_first):
+        row = ticket_rows[first]
+        time_entry_list_detail[projects[project_codes[row]]][dates[day_codes[row]]][
+            tickets[ticket_codes[first]]
+        ][ticket_descriptions[first]] = float(detail_seconds[group]) / 3600
+
+    return (time_entry_list, workingtime_by_day_list, time_entry_list_detail)
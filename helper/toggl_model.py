@@ -0,0 +1,292 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+try:
+    from .toggl_rules import ClassificationRules
+except ImportError:
+    from toggl_rules import ClassificationRules
+
+berlin = ZoneInfo("Europe/Berlin")
+
+
+# returns the adjusted (start, end) of a working day if breaks were not taken
+def break_adjusted(start, end, workinghours):
+    if workinghours > 9:
+        breaktime = 0.75
+    elif workinghours > 6:
+        breaktime = 0.5
+    else:
+        breaktime = 0
+
+    delta_hours = (end - start).total_seconds() / 3600
+    if delta_hours < workinghours + breaktime:
+        diff = (workinghours + breaktime) - delta_hours
+        # either endate is already in the new day or enddate with break would be in the new day
+        if (
+            start.date() < end.date()
+            or (end + timedelta(hours=diff)).date() > end.date()
+        ):
+            # subtract diff from starttime via delta
+            start = start - timedelta(hours=diff)
+        else:
+            # add the breack to the endtime
+            end = end + timedelta(hours=diff)
+    return (start, end)
+
+
+class TimeEntry:
+    __slots__ = (
+        "id",
+        "project",
+        "date",
+        "start",
+        "stop",
+        "seconds",
+        "description",
+        "ticket",
+        "ticket_description",
+    )
+
+    def __init__(
+        self,
+        id,
+        project,
+        date,
+        start,
+        stop,
+        seconds,
+        description,
+        ticket,
+        ticket_description,
+    ):
+        self.id = id
+        self.project = project
+        self.date = date
+        self.start = start
+        self.stop = stop
+        self.seconds = seconds
+        self.description = description
+        self.ticket = ticket
+        self.ticket_description = ticket_description
+
+
+# hours of one project on one day
+class DayAggregate:
+    __slots__ = ("project", "date", "seconds", "descriptions", "tickets")
+
+    def __init__(self, project, date):
+        self.project = project
+        self.date = date
+        self.seconds = 0
+        self.descriptions = []
+        # ticket -> TicketAggregate, only filled for Eucon projects
+        self.tickets = {}
+
+    @property
+    def hours(self):
+        return self.seconds / 3600
+
+    @property
+    def description(self):
+        return ", ".join(self.descriptions)
+
+
+# hours of one ticket in one project on one day
+class TicketAggregate:
+    __slots__ = (
+        "project",
+        "ticket",
+        "date",
+        "seconds",
+        "description",
+        "details",
+        "entry_ids",
+    )
+
+    def __init__(self, project, ticket, date):
+        self.project = project
+        self.ticket = ticket
+        self.date = date
+        self.seconds = 0
+        self.description = None
+        # ticket description -> seconds
+        self.details = {}
+        self.entry_ids = []
+
+    @property
+    def hours(self):
+        return self.seconds / 3600
+
+    def add(self, time_entry):
+        self.seconds += time_entry.seconds
+        self.entry_ids.append(time_entry.id)
+        description = time_entry.ticket_description
+        if self.description is None:
+            self.description = description
+        elif description not in self.description:
+            self.description += ", " + description
+        self.details[description] = (
+            self.details.get(description, 0) + time_entry.seconds
+        )
+
+
+# total hours and first start / last end of one day over all projects
+class WorkingDay:
+    __slots__ = ("date", "seconds", "starttime", "endtime")
+
+    def __init__(self, date, starttime, endtime):
+        self.date = date
+        self.seconds = 0
+        self.starttime = starttime
+        self.endtime = endtime
+
+    @property
+    def hours(self):
+        return self.seconds / 3600
+
+
+# all aggregates of a toggl export with indexes for direct lookups
+class TogglAggregates:
+    __slots__ = ("entries", "days", "working_days", "tickets")
+
+    def __init__(self):
+        self.entries = []
+        # (project, date) -> DayAggregate
+        self.days = {}
+        # date -> WorkingDay
+        self.working_days = {}
+        # (ticket, date) -> [TicketAggregate], one per project the ticket was booked in
+        self.tickets = {}
+
+    def add(self, time_entry):
+        self.entries.append(time_entry)
+        key = (time_entry.project, time_entry.date)
+        day = self.days.get(key)
+        if day is None:
+            day = self.days[key] = DayAggregate(time_entry.project, time_entry.date)
+        day.seconds += time_entry.seconds
+        day.descriptions.append(time_entry.description)
+
+        working_day = self.working_days.get(time_entry.date)
+        if working_day is None:
+            working_day = self.working_days[time_entry.date] = WorkingDay(
+                time_entry.date, time_entry.start, time_entry.stop
+            )
+        working_day.seconds += time_entry.seconds
+        if working_day.starttime > time_entry.start:
+            working_day.starttime = time_entry.start
+        # if I worked into the next day, set 24:00 as enddate. The ANW cannot express the true enddate then
+        if time_entry.stop.date() != time_entry.start.date():
+            working_day.endtime = time_entry.stop.replace(hour=0, minute=0)
+        elif time_entry.stop > working_day.endtime:
+            working_day.endtime = time_entry.stop
+
+        if time_entry.ticket is not None:
+            ticket = day.tickets.get(time_entry.ticket)
+            if ticket is None:
+                ticket = day.tickets[time_entry.ticket] = TicketAggregate(
+                    time_entry.project, time_entry.ticket, time_entry.date
+                )
+                self.tickets.setdefault(
+                    (time_entry.ticket, time_entry.date), []
+                ).append(ticket)
+            ticket.add(time_entry)
+
+    def adjust_for_breaks(self):
+        for working_day in self.working_days.values():
+            working_day.starttime, working_day.endtime = break_adjusted(
+                working_day.starttime, working_day.endtime, working_day.hours
+            )
+
+    # the aggregates of the entries from start_date up to excluding end_date
+    def between(self, start_date, end_date):
+        aggregates = TogglAggregates()
+        for time_entry in self.entries:
+            if str(start_date) <= time_entry.date < str(end_date):
+                aggregates.add(time_entry)
+        aggregates.adjust_for_breaks()
+        return aggregates
+
+    # (ticket, date, seconds, description) per booked ticket and day, projects merged
+    def ticket_cells(self):
+        for (ticket, date), aggregates in self.tickets.items():
+            yield (
+                ticket,
+                date,
+                sum(t.seconds for t in aggregates),
+                ", ".join(t.description for t in aggregates),
+            )
+
+    # the nested dictionaries returned by get_toggl_time_entries
+    def to_legacy(self):
+        time_entry_list = {}
+        time_entry_list_detail = {}
+        for (project, date), day in self.days.items():
+            time_entry_list.setdefault(project, {})[date] = {
+                "hours": day.hours,
+                "description": day.description,
+            }
+            time_entry_list_detail.setdefault(project, {})[date] = {}
+            for ticket, aggregate in day.tickets.items():
+                time_entry_list[project][date][ticket] = {
+                    "hours": aggregate.hours,
+                    "description": aggregate.description,
+                }
+                time_entry_list_detail[project][date][ticket] = {
+                    description: seconds / 3600
+                    for description, seconds in aggregate.details.items()
+                }
+        workingtime_by_day_list = {
+            date: {
+                "hours": working_day.hours,
+                "starttime": working_day.starttime,
+                "endtime": working_day.endtime,
+            }
+            for date, working_day in self.working_days.items()
+        }
+        return (time_entry_list, workingtime_by_day_list, time_entry_list_detail)
+
+
+def _parse_toggl_datetime(timestamp):
+    return datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S%z").astimezone(berlin)
+
+
+# the day a raw toggl entry is booked on
+def entry_date(time_entry):
+    return str(_parse_toggl_datetime(time_entry["start"]).date())
+
+
+# single pass over the raw toggl entries into the typed aggregates
+def build_aggregates(time_entries, client_list, project_list, rules=None):
+    if rules is None:
+        rules = ClassificationRules()
+    aggregates = TogglAggregates()
+    for time_entry in time_entries:
+        # skip entries with negative duration -> current running entries
+        if time_entry["duration"] < 0:
+            continue
+        classification = rules.classify(
+            time_entry["project_id"],
+            time_entry["description"],
+            client_list,
+            project_list,
+        )
+        if classification is None:
+            continue
+        project, ticket, ticket_description = classification
+        start = _parse_toggl_datetime(time_entry["start"])
+        aggregates.add(
+            TimeEntry(
+                time_entry["id"],
+                project,
+                str(start.date()),
+                start,
+                _parse_toggl_datetime(time_entry["stop"]),
+                time_entry["duration"],
+                time_entry["description"],
+                ticket,
+                ticket_description,
+            )
+        )
+    rules.log_hits()
+    return aggregates
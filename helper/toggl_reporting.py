@@ -0,0 +1,196 @@
+import csv
+import json
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from itertools import accumulate
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # only needed for parquet output
+    pyarrow = None
+
+# rollup dimensions and the columns of their keys
+dimensions = {
+    "ticket": ("ticket",),
+    "project": ("project",),
+    # tickets are described by their ticket description, other entries by the toggl description
+    "description": ("project", "ticket", "description"),
+}
+
+
+def _month(day):
+    return day[:7]
+
+
+def _week(day):
+    year, week, _ = date.fromisoformat(day).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _dimension_key(dimension, time_entry):
+    if dimension == "ticket":
+        return None if time_entry.ticket is None else (time_entry.ticket,)
+    if dimension == "project":
+        return (time_entry.project,)
+    if time_entry.ticket is None:
+        return (time_entry.project, None, time_entry.description)
+    return (time_entry.project, time_entry.ticket, time_entry.ticket_description)
+
+
+# (start, end) of named periods, end inclusive
+def period_range(name, today=None):
+    if today is None:
+        today = date.today()
+    first_of_month = today.replace(day=1)
+    if name == "last_month":
+        end = first_of_month - timedelta(days=1)
+        return (end.replace(day=1), end)
+    if name == "this_month":
+        return (first_of_month, today)
+    quarter_start = first_of_month.replace(month=(today.month - 1) // 3 * 3 + 1)
+    if name == "last_quarter":
+        end = quarter_start - timedelta(days=1)
+        return (end.replace(month=(end.month - 1) // 3 * 3 + 1, day=1), end)
+    if name == "this_quarter":
+        return (quarter_start, today)
+    if name == "ytd":
+        return (today.replace(month=1, day=1), today)
+    if name == "last_year":
+        return (date(today.year - 1, 1, 1), date(today.year - 1, 12, 31))
+    raise ValueError("Unknown period " + str(name))
+
+
+# rollups of the toggl entries by ticket, project and description, per day, week and month
+# built once from the TogglAggregates, every period query afterwards only looks up prefix sums
+class TogglRollups:
+    def __init__(self, aggregates):
+        daily = {dimension: {} for dimension in dimensions}
+        self.weekly = {dimension: {} for dimension in dimensions}
+        self.monthly = {dimension: {} for dimension in dimensions}
+        for time_entry in aggregates.entries:
+            day = time_entry.date
+            week, month = _week(day), _month(day)
+            for dimension in dimensions:
+                key = _dimension_key(dimension, time_entry)
+                if key is None:
+                    continue
+                days = daily[dimension].setdefault(key, {})
+                days[day] = days.get(day, 0) + time_entry.seconds
+                weekly = self.weekly[dimension]
+                weekly[(week,) + key] = (
+                    weekly.get((week,) + key, 0) + time_entry.seconds
+                )
+                monthly = self.monthly[dimension]
+                monthly[(month,) + key] = (
+                    monthly.get((month,) + key, 0) + time_entry.seconds
+                )
+
+        # key -> (sorted days, cumulative seconds up to and including that day)
+        self.cumulative = {
+            dimension: {
+                key: (sorted(days), list(accumulate(days[d] for d in sorted(days))))
+                for key, days in keys.items()
+            }
+            for dimension, keys in daily.items()
+        }
+
+    # {key: seconds} of a dimension between start and end (inclusive), None means open
+    def query(self, dimension, start=None, end=None):
+        start = "" if start is None else str(start)
+        end = "9999-12-31" if end is None else str(end)
+        result = {}
+        for key, (days, cumulative) in self.cumulative[dimension].items():
+            low = bisect_left(days, start)
+            high = bisect_right(days, end)
+            if high > low:
+                result[key] = cumulative[high - 1] - (cumulative[low - 1] if low else 0)
+        return result
+
+    # rows sorted by hours, ready for the writers
+    def rows(self, dimension, start=None, end=None):
+        columns = dimensions[dimension]
+        for key, seconds in sorted(
+            self.query(dimension, start, end).items(), key=lambda item: -item[1]
+        ):
+            row = dict(zip(columns, key))
+            row["hours"] = seconds / 3600
+            yield row
+
+    # rows per week or month and key
+    def period_rows(self, dimension, period="month"):
+        rollup = self.weekly if period == "week" else self.monthly
+        columns = (period,) + dimensions[dimension]
+        for key, seconds in sorted(rollup[dimension].items(), key=str):
+            row = dict(zip(columns, key))
+            row["hours"] = seconds / 3600
+            yield row
+
+
+# the writers consume the rows one by one, parquet writes them in batches of this many rows
+parquet_batch_size = 10000
+
+
+def write_csv(rows, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = None
+        for row in rows:
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+
+
+def write_json(rows, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for index, row in enumerate(rows):
+            f.write(",\n" if index else "\n")
+            f.write(json.dumps(row, ensure_ascii=False))
+        f.write("\n]\n")
+
+
+def write_parquet(rows, path):
+    if pyarrow is None:
+        raise ImportError("pyarrow is required for parquet output")
+    writer = None
+    batch = []
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) == parquet_batch_size:
+                writer = _write_parquet_batch(writer, batch, path)
+                batch = []
+        if batch or writer is None:
+            writer = _write_parquet_batch(writer, batch, path)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+# the key columns of the rollup rows are strings (None for missing tickets), hours is a float
+# a fixed schema keeps the batches consistent even if a column is empty in the first batch
+def _write_parquet_batch(writer, batch, path):
+    if writer is None:
+        columns = list(batch[0]) if batch else ["hours"]
+        schema = pyarrow.schema(
+            [
+                (column, pyarrow.float64() if column == "hours" else pyarrow.string())
+                for column in columns
+            ]
+        )
+        writer = pyarrow.parquet.ParquetWriter(path, schema)
+    writer.write_table(pyarrow.Table.from_pylist(batch, schema=writer.schema))
+    return writer
+
+
+# writes the rows in the format of the file extension (.csv, .json or .parquet)
+def write_report(rows, path):
+    if path.endswith(".csv"):
+        write_csv(rows, path)
+    elif path.endswith(".json"):
+        write_json(rows, path)
+    elif path.endswith(".parquet"):
+        write_parquet(rows, path)
+    else:
+        raise ValueError("Unknown report format of " + path)
@@ -0,0 +1,134 @@
+try:
+    from . import config
+except ImportError:
+    import config
+
+import logging
+import re
+from collections import Counter
+
+# the rules that used to be hardcoded in get_toggl_time_entries
+default_rules = {
+    # entries with $ in description were done by other persons
+    "skip_descriptions": ["$"],
+    # nicht die eigenen Projekte
+    "skip_clients": ["Vit"],
+    # travel entries are booked on "<project> - Reisen", matched case insensitive
+    "travel_keywords": ["reisen"],
+    "travel_suffix": " - Reisen",
+    # projects whose name contains "project" need a ticket id at the start of the description
+    "tickets": [{"project": "2779 ", "pattern": r"\w+-\d+"}],
+}
+
+
+# compiles the classification rules into one regex per ticket format, so every entry is
+# classified with a single match call, and counts how often each rule was hit
+class ClassificationRules:
+    def __init__(self, rules=None):
+        if rules is None:
+            rules = getattr(config, "toggl_classification_rules", default_rules)
+        self.skip_clients = set(rules["skip_clients"])
+        self.travel_suffix = rules["travel_suffix"]
+        self.ticket_rules = rules["tickets"]
+        self.hits = Counter()
+
+        # optional lookaheads record skip and travel keywords anywhere in the description,
+        # (?!) never matches and stands in for an empty keyword list
+        lookaheads = "(?=(?:.*?(?P<skip>%s))?)(?=(?:.*?(?P<travel>%s))?)" % (
+            "|".join(re.escape(s) for s in rules["skip_descriptions"]) or "(?!)",
+            "|".join(re.escape(s) for s in rules["travel_keywords"]) or "(?!)",
+        )
+        flags = re.IGNORECASE | re.DOTALL
+        self._plain_matcher = re.compile("^" + lookaheads, flags)
+        # a ticket id is followed by an optional " - " that is cut from the worklog text
+        self._ticket_matchers = [
+            re.compile(
+                "^"
+                + lookaheads
+                + "(?:(?P<ticket>%s)(?P<separator> - )?)?" % ticket_rule["pattern"],
+                flags,
+            )
+            for ticket_rule in self.ticket_rules
+        ]
+        # project_id -> (client_id, project name, matcher, ticket rule index)
+        self._projects = {}
+        # (project_id, description) -> (classification, hit rules)
+        self._classes = {}
+
+    def _project_rule(self, project_id, project_list):
+        project_rule = self._projects.get(project_id)
+        if project_rule is None:
+            project = project_list[project_id]
+            matcher, ticket_rule = self._plain_matcher, None
+            for index, rule in enumerate(self.ticket_rules):
+                if rule["project"] in project["name"]:
+                    matcher, ticket_rule = self._ticket_matchers[index], index
+                    break
+            project_rule = self._projects[project_id] = (
+                project["client_id"],
+                project["name"],
+                matcher,
+                ticket_rule,
+            )
+        return project_rule
+
+    def _evaluate(self, project_id, description, client_list, project_list):
+        if project_id not in project_list:
+            # skipped entries do not need a project, everything else fails on the lookup below
+            if self._plain_matcher.match(description).group("skip") is not None:
+                return (None, ("skip_descriptions",))
+        client_id, project, matcher, ticket_rule = self._project_rule(
+            project_id, project_list
+        )
+        match = matcher.match(description)
+        if match.group("skip") is not None:
+            return (None, ("skip_descriptions",))
+        if client_list.get(client_id) in self.skip_clients:
+            return (None, ("skip_clients",))
+
+        hit = []
+        if match.group("travel") is not None:
+            project += self.travel_suffix
+            hit.append("travel_keywords")
+        if ticket_rule is None:
+            return ((project, None, None), tuple(hit))
+
+        if match.group("ticket") is None:
+            self.hits["missing_ticket"] += 1
+            raise Exception(
+                "-- Description '" + str(description) + "' has no ticket id --"
+            )
+        hit.append("tickets:" + self.ticket_rules[ticket_rule]["project"])
+        ticket_description = description
+        if match.group("separator") is not None:
+            ticket_description = description[match.end() :]
+        if "#" in ticket_description:
+            ticket_description = ticket_description[
+                : ticket_description.index("#")
+            ].strip()
+        return (
+            (project, match.group("ticket").upper(), ticket_description),
+            tuple(hit),
+        )
+
+    # returns None for skipped entries, otherwise (project, ticket, ticket_description)
+    # count is the number of entries sharing this project and description
+    def classify(self, project_id, description, client_list, project_list, count=1):
+        key = (project_id, description)
+        cached = self._classes.get(key)
+        if cached is None:
+            cached = self._classes[key] = self._evaluate(
+                project_id, description, client_list, project_list
+            )
+        classification, hit = cached
+        for rule in hit:
+            self.hits[rule] += count
+        return classification
+
+    def log_hits(self):
+        logging.info(
+            "classification rule hits: "
+            + ", ".join(
+                rule + "=" + str(hits) for rule, hits in sorted(self.hits.items())
+            )
+        )
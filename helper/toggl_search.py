@@ -0,0 +1,143 @@
+try:
+    from . import config
+except ImportError:
+    import config
+
+import logging
+import os
+import re
+import sqlite3
+
+try:
+    from .toggl_cache import cache_dir
+except ImportError:
+    from toggl_cache import cache_dir
+
+index_file = getattr(
+    config, "toggl_search_index", os.path.join(cache_dir, "toggl_search.sqlite")
+)
+
+# sql expression of every supported grouping
+groupings = {
+    "ticket": "e.ticket",
+    "project": "e.project",
+    "description": "e.description",
+    "date": "e.date",
+    "month": "substr(e.date, 1, 7)",
+    "year": "substr(e.date, 1, 4)",
+}
+
+
+# turns free text into an fts5 query: every word has to match, "word*" matches prefixes
+# ticket ids like EUC-123 contain characters fts5 only accepts in quoted strings
+def match_expression(text):
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+# local full-text index over the toggl entries, queries never touch the toggl api
+class TogglSearchIndex:
+    def __init__(self, path=None):
+        self.path = path or index_file
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY, date TEXT NOT NULL, project TEXT NOT NULL,
+                ticket TEXT, description TEXT NOT NULL, seconds INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_date ON entries (date);
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5 (
+                description, ticket, project, content='entries', content_rowid='id',
+                tokenize="unicode61 tokenchars '-'"
+            );
+            CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+                INSERT INTO entries_fts (rowid, description, ticket, project)
+                VALUES (new.id, new.description, new.ticket, new.project);
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+                INSERT INTO entries_fts (entries_fts, rowid, description, ticket, project)
+                VALUES ('delete', old.id, old.description, old.ticket, old.project);
+            END;
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    # replaces the indexed entries of [start_date, end_date) with the entries of the aggregates
+    def index_aggregates(self, aggregates, start_date, end_date):
+        with self.db:
+            self.db.execute(
+                "DELETE FROM entries WHERE date >= ? AND date < ?",
+                (str(start_date), str(end_date)),
+            )
+            # entries of the neighbouring days (time zones) are replaced by id
+            self.db.executemany(
+                "DELETE FROM entries WHERE id = ?",
+                ((time_entry.id,) for time_entry in aggregates.entries),
+            )
+            self.db.executemany(
+                "INSERT INTO entries (id, date, project, ticket, description, seconds) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        time_entry.id,
+                        time_entry.date,
+                        time_entry.project,
+                        time_entry.ticket,
+                        time_entry.ticket_description
+                        if time_entry.ticket is not None
+                        else time_entry.description,
+                        time_entry.seconds,
+                    )
+                    for time_entry in aggregates.entries
+                ),
+            )
+        logging.info(
+            "indexed "
+            + str(len(aggregates.entries))
+            + " toggl entries for "
+            + str(start_date)
+            + " to "
+            + str(end_date)
+        )
+
+    # [(group, seconds, entry count)] of the entries matching the text, sorted by seconds
+    # raw passes the text as fts5 query syntax (AND/OR/NOT, column filters like ticket:...)
+    def sum_hours(self, text, start_date=None, end_date=None, group_by=None, raw=False):
+        group = groupings[group_by] if group_by else "'total'"
+        sql = (
+            "SELECT " + group + ", SUM(e.seconds), COUNT(*) FROM entries_fts "
+            "JOIN entries e ON e.id = entries_fts.rowid WHERE entries_fts MATCH ?"
+        )
+        params = [text if raw else match_expression(text)]
+        if not re.search(r"\S", params[0]):
+            # no search text, everything in the period counts
+            sql = (
+                "SELECT " + group + ", SUM(e.seconds), COUNT(*) FROM entries e WHERE 1"
+            )
+            params = []
+        if start_date is not None:
+            sql += " AND e.date >= ?"
+            params.append(str(start_date))
+        if end_date is not None:
+            sql += " AND e.date <= ?"
+            params.append(str(end_date))
+        sql += " GROUP BY 1 ORDER BY 2 DESC"
+        return self.db.execute(sql, params).fetchall()
+
+    def date_range(self):
+        return self.db.execute("SELECT MIN(date), MAX(date) FROM entries").fetchone()
@@ -0,0 +1,246 @@
+try:
+    from . import config
+except ImportError:
+    import config
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import date, datetime, timedelta, timezone
+
+try:
+    from .toggl_cache import cache_dir, token_fingerprint
+except ImportError:
+    from toggl_cache import cache_dir, token_fingerprint
+
+store_file = getattr(
+    config, "toggl_entry_store", os.path.join(cache_dir, "toggl_entries.sqlite")
+)
+# toggl only answers "since" requests for roughly the last three months
+max_cursor_age = timedelta(days=80)
+# entries edited while a request is running must not slip through between two syncs
+cursor_safety_margin_seconds = 300
+
+
+def _to_utc_string(timestamp):
+    return (
+        datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+        .astimezone(timezone.utc)
+        .strftime("%Y-%m-%dT%H:%M:%S")
+    )
+
+
+def as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+def _utc_date(unix_timestamp):
+    return datetime.fromtimestamp(unix_timestamp, timezone.utc).date()
+
+
+def _merge_ranges(ranges):
+    # ranges are [start, end) pairs of iso date strings
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+# local copy of the toggl time entries, kept up to date with toggl's "since" parameter
+class TogglEntryStore:
+    def __init__(self, path=None):
+        self.path = path or store_file
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS time_entries ("
+            "id INTEGER PRIMARY KEY, start_utc TEXT NOT NULL, at TEXT, data TEXT NOT NULL)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS time_entries_start ON time_entries (start_utc)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        if self._get_state("account") != token_fingerprint():
+            # never mix entries of two toggl accounts
+            self.reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def _get_state(self, key):
+        row = self.db.execute(
+            "SELECT value FROM sync_state WHERE key = ?", (key,)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _set_state(self, key, value):
+        self.db.execute(
+            "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+            (key, json.dumps(value)),
+        )
+
+    def reset(self):
+        logging.info("resetting local toggl entry store")
+        self.db.execute("DELETE FROM time_entries")
+        self.db.execute("DELETE FROM sync_state")
+        self._set_state("account", token_fingerprint())
+        self.db.commit()
+
+    @property
+    def cursor(self):
+        return self._get_state("cursor")
+
+    def cursor_is_fresh(self):
+        cursor = self.cursor
+        return (
+            cursor is not None and time.time() - cursor < max_cursor_age.total_seconds()
+        )
+
+    def covers(self, start_date, end_date):
+        for start, end in self._get_state("covered") or []:
+            if start <= str(start_date) and str(end_date) <= end:
+                return True
+        return False
+
+    def _upsert(self, time_entries):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO time_entries (id, start_utc, at, data) VALUES (?, ?, ?, ?)",
+            [
+                (
+                    time_entry["id"],
+                    _to_utc_string(time_entry["start"]),
+                    time_entry.get("at"),
+                    json.dumps(time_entry),
+                )
+                for time_entry in time_entries
+            ],
+        )
+
+    # apply the answer of a "since" request, returns the changed entries
+    def apply_changes(self, time_entries, request_time):
+        previous_cursor = self.cursor
+        deleted = [
+            (time_entry["id"],)
+            for time_entry in time_entries
+            if time_entry.get("server_deleted_at") is not None
+        ]
+        changed = [
+            time_entry
+            for time_entry in time_entries
+            if time_entry.get("server_deleted_at") is None
+        ]
+        self.db.executemany("DELETE FROM time_entries WHERE id = ?", deleted)
+        self._upsert(changed)
+        # ranges that reached into the future at the last sync are still complete,
+        # every entry created since then was part of this answer
+        live_from = str(_utc_date(previous_cursor) + timedelta(days=1))
+        new_end = str(_utc_date(request_time) + timedelta(days=1))
+        self._set_state(
+            "covered",
+            _merge_ranges(
+                [start, max(end, new_end) if end >= live_from else end]
+                for start, end in self._get_state("covered") or []
+            ),
+        )
+        self._set_state("cursor", int(request_time) - cursor_safety_margin_seconds)
+        self.db.commit()
+        logging.info(
+            "toggl entry store: "
+            + str(len(changed))
+            + " changed, "
+            + str(len(deleted))
+            + " deleted entries"
+        )
+        return time_entries
+
+    # replace everything in [start_date, end_date) with a full download of that range
+    def replace_range(self, start_date, end_date, time_entries, request_time):
+        self.db.execute(
+            "DELETE FROM time_entries WHERE start_utc >= ? AND start_utc < ?",
+            (str(start_date), str(end_date)),
+        )
+        self._upsert(
+            time_entry
+            for time_entry in time_entries
+            if time_entry.get("server_deleted_at") is None
+        )
+        covered = self._get_state("covered") or []
+        covered.append([str(start_date), str(end_date)])
+        self._set_state("covered", _merge_ranges(covered))
+        if self.cursor is None:
+            self._set_state("cursor", int(request_time) - cursor_safety_margin_seconds)
+        self.db.commit()
+
+    # the stored versions of the given entry ids
+    def read_entries(self, ids):
+        entries = []
+        for offset in range(0, len(ids), 500):
+            batch = list(ids[offset : offset + 500])
+            rows = self.db.execute(
+                "SELECT data FROM time_entries WHERE id IN ("
+                + ", ".join("?" * len(batch))
+                + ")",
+                batch,
+            )
+            entries.extend(json.loads(row[0]) for row in rows)
+        return entries
+
+    # returns the stored entries in toggl's order (newest first)
+    def read_range(self, start_date, end_date):
+        rows = self.db.execute(
+            "SELECT data FROM time_entries WHERE start_utc >= ? AND start_utc < ? "
+            "ORDER BY start_utc DESC, id DESC",
+            (str(start_date), str(end_date)),
+        )
+        return [json.loads(row[0]) for row in rows]
+
+
+# brings the store up to date for the given range with as few requests as possible
+# fetch_range(start_date, end_date) and fetch_since(unix_timestamp) do the actual http requests
+def sync_time_entries(store, start_date, end_date, fetch_range, fetch_since):
+    start_date, end_date = as_date(start_date), as_date(end_date)
+
+    if store.cursor is not None and not store.cursor_is_fresh():
+        # toggl does not answer "since" requests this far back, start over
+        store.reset()
+
+    if store.cursor is not None:
+        # update everything that is already stored, this is usually a tiny request
+        request_time = time.time()
+        store.apply_changes(fetch_since(store.cursor), request_time)
+
+    if not store.covers(start_date, end_date):
+        logging.info(
+            "toggl entry store does not cover "
+            + str(start_date)
+            + " to "
+            + str(end_date)
+            + ", fetching full range"
+        )
+        request_time = time.time()
+        # a range reaching today is fetched up to tomorrow, later syncs then keep it complete
+        fetch_end = end_date
+        if end_date >= _utc_date(request_time):
+            fetch_end = max(end_date, _utc_date(request_time) + timedelta(days=1))
+        store.replace_range(
+            start_date, fetch_end, fetch_range(start_date, fetch_end), request_time
+        )
+
+    return store.read_range(start_date, end_date)
@@ -0,0 +1,158 @@
+import random
+from datetime import date, datetime, timedelta, timezone
+
+# clients whose projects are dropped by the default classification rules
+skipped_clients = ["Vit"]
+ticket_prefixes = ["EUC", "PLAT", "DATA", "OPS"]
+ticket_texts = [
+    "Code Review",
+    "Implementierung",
+    "Bugfix",
+    "Abstimmung",
+    "Deployment",
+    "Dokumentation",
+    "Refinement",
+]
+project_texts = [
+    "Meeting",
+    "Recherche crisp-dm | asum-dm",
+    "Konzept",
+    "Angebot",
+    "Schulung",
+    "Support",
+    "Administration",
+]
+
+
+def _timestamp(value, utc_suffix):
+    # toggl sends both notations, the aggregation has to cope with either of them
+    return value.strftime("%Y-%m-%dT%H:%M:%S") + utc_suffix
+
+
+# builds toggl lookup tables and raw time entries in the format of /me/time_entries
+# returns (client_list, project_list, time_entries) like fetch_toggl_data, entries newest first
+# projects with "2779 " in their name are ticket projects, their descriptions start with a ticket id
+def generate_toggl_data(
+    entry_count,
+    users=1,
+    clients=4,
+    projects=12,
+    tickets=200,
+    entries_per_day=8,
+    cross_midnight_share=0.02,
+    travel_share=0.03,
+    skip_share=0.01,
+    end_date=None,
+    seed=0,
+):
+    generator = random.Random(seed)
+    if end_date is None:
+        end_date = date.today()
+
+    client_list = {}
+    for index in range(clients):
+        name = skipped_clients[0] if index == clients - 1 else "Kunde " + str(index)
+        client_list[1000 + index] = name
+    client_ids = list(client_list)
+
+    project_list = {}
+    ticket_projects = []
+    for index in range(projects):
+        project_id = 100000 + index
+        # every third project books on jira tickets
+        if index % 3 == 0:
+            name = "2779 Eucon Projekt " + str(index)
+            ticket_projects.append(project_id)
+        else:
+            name = str(3000 + index) + " Projekt " + str(index)
+        project_list[project_id] = {
+            "name": name,
+            "client_id": client_ids[index % (clients - 1 or 1)],
+        }
+    # one project of the skipped client, its entries never reach the aggregates
+    if clients > 1:
+        project_list[100000 + projects] = {
+            "name": "Eigenes Projekt",
+            "client_id": client_ids[-1],
+        }
+    project_ids = list(project_list)
+
+    ticket_ids = [
+        generator.choice(ticket_prefixes) + "-" + str(generator.randint(1, 9999))
+        for _ in range(tickets)
+    ]
+
+    time_entries = []
+    entry_id = 3000000000
+    day = end_date
+    while len(time_entries) < entry_count:
+        day_entries = []
+        for user in range(users):
+            # a working day starts between 6 and 9 o'clock utc
+            start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+            start += timedelta(minutes=generator.randint(360, 540))
+            count = max(1, int(generator.gauss(entries_per_day, entries_per_day / 4)))
+            for position in range(count):
+                # entries past midnight would overlap the next working day
+                if (
+                    len(time_entries) + len(day_entries) >= entry_count
+                    or start.date() > day
+                ):
+                    break
+                project_id = generator.choice(project_ids)
+                duration = generator.randint(5, 120) * 60
+                if position == count - 1 and generator.random() < cross_midnight_share:
+                    # late work that ends after midnight in Berlin, only if the day has not
+                    # passed 20 o'clock yet, entries of a user never overlap
+                    evening = datetime(
+                        day.year,
+                        day.month,
+                        day.day,
+                        20,
+                        generator.randint(0, 59),
+                        tzinfo=timezone.utc,
+                    )
+                    if start <= evening:
+                        start = evening
+                        duration = generator.randint(180, 300) * 60
+
+                if generator.random() < skip_share:
+                    description = "$ " + generator.choice(project_texts)
+                elif project_id in ticket_projects:
+                    description = (
+                        generator.choice(ticket_ids)
+                        + " - "
+                        + generator.choice(ticket_texts)
+                    )
+                else:
+                    description = generator.choice(project_texts)
+                if generator.random() < travel_share:
+                    description += " Reisen"
+
+                stop = start + timedelta(seconds=duration)
+                entry_id += 1
+                day_entries.append(
+                    {
+                        "id": entry_id,
+                        "workspace_id": 3242752,
+                        "user_id": 7000000 + user,
+                        "project_id": project_id,
+                        "task_id": None,
+                        "billable": False,
+                        "start": _timestamp(start, "+00:00"),
+                        "stop": _timestamp(stop, "Z"),
+                        "duration": duration,
+                        "description": description,
+                        "tags": None,
+                        "tag_ids": None,
+                        "duronly": True,
+                        "at": _timestamp(stop, "+00:00"),
+                        "server_deleted_at": None,
+                    }
+                )
+                start = stop + timedelta(minutes=generator.randint(0, 15))
+        day_entries.sort(key=lambda time_entry: time_entry["start"], reverse=True)
+        time_entries.extend(day_entries)
+        day -= timedelta(days=1)
+
+    return (client_list, project_list, time_entries)
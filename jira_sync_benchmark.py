@@ -0,0 +1,107 @@
+import logging
+import sys
+import time
+import types
+from datetime import date, timedelta
+
+# the benchmark needs no credentials, without a local helper/config.py a stub is used
+# it has to be in place before the helper modules import the config
+try:
+    import helper.config as config
+except ImportError:
+    config = types.ModuleType("helper.config")
+    config.jira_user = "benchmark@example.com"
+    config.jira_token = "token"
+    config.jira_account_id = "benchmark"
+    sys.modules["helper.config"] = config
+
+import toggl_to_jira_transfer as transfer
+from helper import jira_client
+from helper.jira_fake_server import FakeJiraServer
+from helper.toggl_model import build_aggregates
+from helper.toggl_rules import ClassificationRules, default_rules
+from helper.toggl_synthetic import generate_toggl_data
+
+# measures the toggl to jira sync against the local fake jira server instead of production
+# issue count can be overridden on the command line: python jira_sync_benchmark.py 5000
+issue_count = 2000
+worklogs_per_issue = 3
+toggl_entry_count = 5000
+latency_seconds = 0.02
+# None disables the rate limit of the fake server
+requests_per_second = None
+throttle_probability = 0.0
+
+
+def timed(server, name, function):
+    server.stats.clear()
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    print(
+        f"{name:<34}{seconds:8.2f} s {sum(server.stats.values()):7} requests "
+        f"{server.stats['429']:5} x 429"
+    )
+    return result
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s %(levelname)s %(message)s",
+        handlers=[logging.StreamHandler()],
+    )
+    if len(sys.argv) > 1:
+        issue_count = int(sys.argv[1])
+
+    end_date = date.today()
+    start_date = end_date - timedelta(days=30)
+    with FakeJiraServer(
+        latency_seconds=latency_seconds,
+        requests_per_second=requests_per_second,
+        throttle_probability=throttle_probability,
+        account_ids={config.jira_user: config.jira_account_id},
+    ) as server:
+        server.populate(
+            issue_count, worklogs_per_issue, start_date, end_date, config.jira_user
+        )
+        transfer.jira_url = server.url
+        jira_client.get_jira(server.url)
+        print(
+            f"--------- {issue_count} issues, {len(server.worklogs)} worklogs, "
+            f"{latency_seconds * 1000:.0f} ms latency ---------"
+        )
+
+        config.jira_worklog_fetch = "bulk"
+        timed(
+            server,
+            "fetch worklogs (bulk)",
+            lambda: transfer.get_eucon_jira_worklogs(start_date, end_date),
+        )
+        config.jira_worklog_fetch = "issues"
+        jira_worklog_list, jira_worklog_ids = timed(
+            server,
+            "fetch worklogs (per issue)",
+            lambda: transfer.get_eucon_jira_worklogs(start_date, end_date),
+        )
+
+        client_list, project_list, time_entries = generate_toggl_data(
+            toggl_entry_count, tickets=issue_count, end_date=end_date - timedelta(1)
+        )
+        aggregates = build_aggregates(
+            time_entries, client_list, project_list, ClassificationRules(default_rules)
+        )
+        # the synthetic toggl tickets have to exist in jira
+        for ticket, _ in aggregates.tickets:
+            if ticket not in server.issues:
+                server.add_issue(ticket)
+        timed(
+            server,
+            "sync toggl to jira (auto)",
+            lambda: transfer.add_missing_entries_for_eucon(
+                aggregates,
+                jira_worklog_list,
+                policy="auto",
+                jiraWorklogIds=jira_worklog_ids,
+            ),
+        )
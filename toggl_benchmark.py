@@ -0,0 +1,166 @@
+import io
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import types
+from contextlib import redirect_stdout
+
+# the benchmark needs no credentials, without a local helper/config.py a stub is used
+# it has to be in place before the helper modules import the config
+try:
+    import helper.config  # noqa: F401
+except ImportError:
+    sys.modules["helper.config"] = types.ModuleType("helper.config")
+
+from helper.toggl_columnar import aggregate_time_entries_columnar, np
+from helper.toggl_model import build_aggregates
+from helper.toggl_parse_data import adjust_for_breaks, aggregate_time_entries
+from helper.toggl_reporting import TogglRollups
+from helper.toggl_rules import ClassificationRules, default_rules
+from helper.toggl_synthetic import generate_toggl_data
+from toggl_list_done_tasks import printDoneTasks
+
+# entry counts to benchmark, can be overridden on the command line: python toggl_benchmark.py 1000 50000
+entry_counts = [1_000, 100_000, 1_000_000]
+# peak memory is measured in a second run, tracemalloc slows the timed run down otherwise
+measure_memory = True
+# results of the last run, a stage more than regression_tolerance times slower is reported
+results_file = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "toggl_benchmark_results.json"
+)
+regression_tolerance = 1.2
+
+
+def run_stage(function):
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+
+    peak = None
+    if measure_memory:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return (result, seconds, peak)
+
+
+def benchmark(entry_count):
+    client_list, project_list, time_entries = generate_toggl_data(entry_count)
+    payload = json.dumps(time_entries)
+
+    # the synthetic data follows the default rules, not the ones of the local config
+    # every run gets new rules, their classification cache would favour later runs
+    def rules():
+        return ClassificationRules(default_rules)
+
+    def report(aggregates):
+        with redirect_stdout(io.StringIO()):
+            printDoneTasks(aggregates)
+
+    stages = {}
+    results = {}
+
+    def stage(name, function):
+        result, seconds, peak = run_stage(function)
+        stages[name] = {"seconds": seconds, "peak_bytes": peak}
+        results[name] = result
+
+    stage("parse json", lambda: json.loads(payload))
+    # the nested dictionaries are derived from the model, this is the model plus the conversion
+    stage(
+        "aggregate legacy",
+        lambda: aggregate_time_entries(
+            time_entries, client_list, project_list, rules()
+        ),
+    )
+    if np is not None:
+        stage(
+            "aggregate columnar",
+            lambda: aggregate_time_entries_columnar(
+                time_entries, client_list, project_list, rules()
+            ),
+        )
+    stage(
+        "aggregate model",
+        lambda: build_aggregates(time_entries, client_list, project_list, rules()),
+    )
+    # break adjustment works in place, every run gets a fresh copy of the working days
+    workingtime_by_day_list = results["aggregate legacy"][1]
+    stage(
+        "adjust breaks",
+        lambda: adjust_for_breaks(
+            {day: dict(value) for day, value in workingtime_by_day_list.items()}
+        ),
+    )
+    # the model adjusts its working days in place as well, each run starts from the unadjusted times
+    model = results["aggregate model"]
+    unadjusted = {
+        day: (working_day.starttime, working_day.endtime)
+        for day, working_day in model.working_days.items()
+    }
+
+    def adjust_model_breaks():
+        for day, (starttime, endtime) in unadjusted.items():
+            working_day = model.working_days[day]
+            working_day.starttime, working_day.endtime = starttime, endtime
+        model.adjust_for_breaks()
+
+    stage("adjust breaks model", adjust_model_breaks)
+    stage("build rollups", lambda: TogglRollups(results["aggregate model"]))
+    stage("report done tasks", lambda: report(results["build rollups"]))
+    return stages
+
+
+def compare(results, previous):
+    for entry_count, stages in results.items():
+        for name, stage in stages.items():
+            before = previous.get(entry_count, {}).get(name)
+            if before is None or not before["seconds"]:
+                continue
+            ratio = stage["seconds"] / before["seconds"]
+            if ratio > regression_tolerance:
+                logging.warning(
+                    "regression: "
+                    + name
+                    + " with "
+                    + entry_count
+                    + " entries takes "
+                    + f"{ratio:.2f}"
+                    + "x as long as in the last run"
+                )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s %(levelname)s %(message)s",
+        handlers=[logging.StreamHandler()],
+    )
+
+    if len(sys.argv) > 1:
+        entry_counts = [int(argument) for argument in sys.argv[1:]]
+
+    results = {}
+    for entry_count in entry_counts:
+        print(f"--------- {entry_count} entries ---------------------------------")
+        stages = benchmark(entry_count)
+        for name, stage in stages.items():
+            peak = stage["peak_bytes"]
+            memory = f"{peak / 2**20:9.1f} MiB" if peak is not None else ""
+            print(f"{name:<22}{stage['seconds']:9.3f} s {memory}")
+        # json object keys are strings
+        results[str(entry_count)] = stages
+
+    previous = {}
+    if os.path.exists(results_file):
+        with open(results_file, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        compare(results, previous)
+    # entry counts that were not run this time keep their last result
+    previous.update(results)
+    with open(results_file, "w", encoding="utf-8") as f:
+        json.dump(previous, f, indent=2)
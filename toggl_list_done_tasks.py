@@ -1,49 +1,38 @@
-from helper.toggl_parse_data import get_toggl_time_entries
+from helper.toggl_cache import invalidate_toggl_metadata, refresh_flag
+from helper.toggl_parse_data import get_toggl_aggregates
+from helper.toggl_reporting import TogglRollups, period_range, write_report
+import argparse
 import logging
-from datetime import date, datetime
-from dateutil.relativedelta import relativedelta
+from datetime import timedelta
 
 jira_url = "https://eucon.atlassian.net"
 
-def printDoneTasks (timeEntryList):
-    
-    doneListSummed = {}
-    doneListByTicket = {}
-    hoursSum = 0
-    for project in timeEntryList:
-        if "2779 " in project:
-            for date in timeEntryList[project]:
-                for ticket in timeEntryList[project][date]:
-                    for description, hours in timeEntryList[project][date][ticket].items():
-                            
-                        if doneListSummed.get(ticket) is None:
-                            doneListSummed[ticket] = {}
-                        if doneListSummed[ticket].get("hours") is None:
-                            doneListSummed[ticket]["hours"] = hours
-                            doneListSummed[ticket]["description"] = description
-                        else:
-                            doneListSummed[ticket]["hours"] += hours
-                            doneListSummed[ticket]["description"] += ", " + description
-                    
-                        if doneListByTicket.get(ticket) is None:
-                            doneListByTicket[ticket] = {}
-                        if doneListByTicket[ticket].get(description) is None:
-                            doneListByTicket[ticket][description] = hours
-                        else:
-                            doneListByTicket[ticket][description] += hours
-                        
-                        hoursSum += hours
-    
+# python toggl_list_done_tasks.py                                 hours per ticket of the last month
+# python toggl_list_done_tasks.py --range ytd --details           with the hours per description
+# python toggl_list_done_tasks.py --range last_year --period month --output done_tasks.csv
+#                                                                 per ticket and month for the managers
+
+def printDoneTasks (rollups, start_date=None, end_date=None, details=False):
+
+    # hours per ticket come from the precomputed rollups, any period can be asked for
+    doneListSummed = rollups.query("ticket", start_date, end_date)
+    hoursSum = sum(doneListSummed.values()) / 3600
+    descriptionRows = list(rollups.rows("description", start_date, end_date)) if details else []
+
     print(f"--------- Sort by Time Spend -----------------------------------------")
-    sorted_tickets = sorted(doneListSummed.items(), key=lambda x: x[1]["hours"], reverse=True) # sorted by hours
-    for key, value in sorted_tickets:
-        ticket = doneListByTicket[key]
-        sorted_dates = sorted(ticket.items(), key=lambda x: x[1], reverse=True)
-        print(f"{key}: {value['hours']}h")
-        # for key_desc, value_desc in sorted_dates:
-        #     print(f"-- {value_desc}h - {key_desc}")
+    sorted_tickets = sorted(doneListSummed.items(), key=lambda x: x[1], reverse=True) # sorted by hours
+    for (key,), seconds in sorted_tickets:
+        print(f"{key}: {seconds / 3600}h")
+        for row in descriptionRows:
+            if row["ticket"] == key: print(f"-- {row['hours']}h - {row['description']}")
     print("Gesamtstunden: " + str(hoursSum) + " h")
-        
+
+
+def printPeriodRows (rows):
+    for row in rows:
+        period = row.get("week") or row.get("month")
+        print(f"{period} {row['ticket']}: {row['hours']}h")
+
 
 if __name__ == '__main__':
 
@@ -56,21 +45,41 @@ if __name__ == '__main__':
         ]
     )
 
+    parser = argparse.ArgumentParser(description="Hours per Jira ticket booked in toggl")
+    parser.add_argument("--range", default="last_month",
+                        choices=["last_month", "this_month", "last_quarter", "this_quarter", "ytd", "last_year"],
+                        help="period to report")
+    parser.add_argument("--period", choices=["week", "month"], help="hours per ticket and week or month")
+    parser.add_argument("--details", action="store_true", help="hours per description of every ticket")
+    parser.add_argument("--output", help="write the rows to a .csv, .json or .parquet file")
+    parser.add_argument(refresh_flag, action="store_true", help="reload the toggl clients and projects")
+    args = parser.parse_args()
+    if args.refresh_toggl_metadata:
+        invalidate_toggl_metadata()
+
     logging.info("----------------------------------------")
     logging.info("List ToDos")
     logging.debug("Debugging is enabled")
-    
-    
-    # start_date = date(2023, 9, 1)
-    # set start date to first day of previous month
-    start_date = date.today().replace(day=1) - relativedelta(months=1)
-    
-    end_date = datetime.now().date().replace(day=1) #+ relativedelta(days=1)
+
+
+    # period ends are inclusive, toggl excludes the end date
+    start_date, end_date = period_range(args.range)
     logging.debug("Start Date: " + str(start_date))
     logging.debug("End Date: " + str(end_date))
-    
-    time_entry_list, workingtime_by_day_list, time_entry_list_detail = get_toggl_time_entries(start_date, end_date)
-    
-    printDoneTasks(time_entry_list_detail)
 
-    logging.info("Finished List ToDos")
\ No newline at end of file
+    # fetch month by month in parallel, long ranges would otherwise be truncated by toggl
+    aggregates = get_toggl_aggregates(start_date, end_date + timedelta(days=1), window="month")
+    rollups = TogglRollups(aggregates)
+
+    if args.period:
+        rows = rollups.period_rows("ticket", args.period)
+        if args.output:
+            write_report(rows, args.output)
+        else:
+            printPeriodRows(rows)
+    else:
+        printDoneTasks(rollups, start_date, end_date, args.details)
+        if args.output:
+            write_report(rollups.rows("description" if args.details else "ticket", start_date, end_date), args.output)
+
+    logging.info("Finished List ToDos")
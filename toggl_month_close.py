@@ -0,0 +1,106 @@
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+import helper.config as config
+import toggl_list_done_tasks
+import toggl_to_anw_transfer
+import toggl_to_jira_transfer
+from helper import jira_reconcile
+from helper.toggl_cache import handle_refresh_flag
+from helper.toggl_parse_data import get_toggl_aggregates
+from helper.toggl_reporting import TogglRollups
+
+# month-end close in one run: toggl is fetched and aggregated once for the union of all
+# ranges and handed to the jira sync, the ANW and the done task report
+# the jira sync and the report run in background threads, the ANW stays on the main thread
+# because Excel (COM) and the tk dialogs must not be driven from other threads
+
+
+def sync_jira(aggregates, start_date, end_date):
+    toggl_to_jira_transfer.sync_toggl_to_jira(
+        aggregates.between(start_date, end_date), start_date, end_date
+    )
+
+
+def print_report(aggregates, start_date, end_date):
+    # rollup queries are end inclusive
+    toggl_list_done_tasks.printDoneTasks(
+        TogglRollups(aggregates), start_date, end_date - timedelta(days=1)
+    )
+
+
+def fill_anw(aggregates, folder, file, start_date, end_date):
+    time_entry_list, workingtime_by_day_list, time_entry_list_detail = (
+        aggregates.between(start_date, end_date).to_legacy()
+    )
+    toggl_to_anw_transfer.transfer_anw_month(
+        folder, file, time_entry_list, workingtime_by_day_list
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+        handlers=[logging.FileHandler("debug.log"), logging.StreamHandler()],
+    )
+
+    logging.info("----------------------------------------")
+    logging.info("Starting Toggl month close")
+    # --refresh-toggl-metadata reloads the toggl clients and projects
+    handle_refresh_flag(sys.argv)
+
+    # same ranges as the single scripts: jira and the report from the first day of the
+    # previous month, jira up to today, the report up to the current month, the ANW its month
+    today = date.today()
+    jira_start = today.replace(day=1) - relativedelta(months=1)
+    jira_end = today
+    report_start = jira_start
+    report_end = today.replace(day=1)
+    folder, file = toggl_to_anw_transfer.find_anw_file()
+    anw_start, anw_end = toggl_to_anw_transfer.anw_month_range(file)
+
+    start_date = min(jira_start, report_start, anw_start)
+    end_date = max(jira_end, report_end, anw_end)
+    aggregates = get_toggl_aggregates(start_date, end_date, window="month")
+
+    failed = []
+
+    def wait(name, future):
+        try:
+            future.result()
+        except Exception:
+            logging.exception(name + " failed")
+            failed.append(name)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = {}
+        # the "ask" policy asks on the console, it must not run next to the ANW dialogs
+        if jira_reconcile.default_policy == "ask" and not getattr(
+            config, "jira_sync_dry_run", False
+        ):
+            wait("jira", executor.submit(sync_jira, aggregates, jira_start, jira_end))
+        else:
+            futures["jira"] = executor.submit(
+                sync_jira, aggregates, jira_start, jira_end
+            )
+        futures["report"] = executor.submit(
+            print_report, aggregates, report_start, report_end
+        )
+
+        try:
+            fill_anw(aggregates, folder, file, anw_start, anw_end)
+        except Exception:
+            logging.exception("anw failed")
+            failed.append("anw")
+
+        for name, future in futures.items():
+            wait(name, future)
+
+    if failed:
+        raise Exception("Month close incomplete, failed: " + ", ".join(failed))
+    logging.info("Finished Toggl month close")
@@ -0,0 +1,83 @@
+import argparse
+import logging
+import time
+from datetime import date, timedelta
+
+from helper.toggl_cache import invalidate_toggl_metadata, refresh_flag
+from helper.toggl_parse_data import get_toggl_aggregates
+from helper.toggl_search import TogglSearchIndex, groupings
+
+# python toggl_query.py update 2021-01-01            index everything since then (uses the toggl api)
+# python toggl_query.py crisp-dm --by month          hours of all entries mentioning crisp-dm
+# python toggl_query.py "EUC-12*" --from 2024-01-01  hours of all EUC-12.. tickets in 2024
+# queries only read the local index, they never call toggl
+
+
+def update_index(start_date, end_date):
+    # fetched month by month, the local entry store makes repeated updates cheap
+    aggregates = get_toggl_aggregates(start_date, end_date, window="month")
+    with TogglSearchIndex() as index:
+        index.index_aggregates(aggregates, start_date, end_date)
+
+
+def print_query(text, start_date, end_date, group_by, raw):
+    start = time.perf_counter()
+    with TogglSearchIndex() as index:
+        rows = index.sum_hours(text, start_date, end_date, group_by, raw)
+        first, last = index.date_range()
+    milliseconds = (time.perf_counter() - start) * 1000
+
+    total_seconds = 0
+    total_entries = 0
+    for group, seconds, count in rows:
+        total_seconds += seconds
+        total_entries += count
+        if group_by:
+            print(f"{str(group):<40}{seconds / 3600:10.2f} h {count:7} entries")
+    print(
+        f"{'Gesamtstunden':<40}{total_seconds / 3600:10.2f} h {total_entries:7} entries"
+    )
+    logging.info(f"query took {milliseconds:.1f} ms, index covers {first} to {last}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+        handlers=[logging.FileHandler("debug.log"), logging.StreamHandler()],
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Sum toggl hours of entries matching a full-text query"
+    )
+    parser.add_argument(
+        "query", help='search text, or "update" to refresh the local index'
+    )
+    parser.add_argument("start", nargs="?", help="update: first day to index")
+    parser.add_argument("end", nargs="?", help="update: day after the last to index")
+    parser.add_argument("--from", dest="start_date", help="first day (yyyy-mm-dd)")
+    parser.add_argument("--to", dest="end_date", help="last day (yyyy-mm-dd)")
+    parser.add_argument("--by", choices=sorted(groupings), help="group the hours")
+    parser.add_argument(
+        "--raw", action="store_true", help="pass the query as fts5 syntax"
+    )
+    parser.add_argument(
+        refresh_flag, action="store_true", help="reload the toggl clients and projects"
+    )
+    args = parser.parse_args()
+    if args.refresh_toggl_metadata:
+        invalidate_toggl_metadata()
+
+    if args.query == "update":
+        # without dates the previous and the current month are indexed
+        start_date = (
+            date.fromisoformat(args.start)
+            if args.start
+            else (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+        )
+        end_date = (
+            date.fromisoformat(args.end) if args.end else date.today() + timedelta(1)
+        )
+        update_index(start_date, end_date)
+    else:
+        print_query(args.query, args.start_date, args.end_date, args.by, args.raw)
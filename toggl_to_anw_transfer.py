@@ -3,24 +3,304 @@ import os
 import re
 import shutil
 import sys
-import tkinter as tk
 from datetime import datetime, timedelta
-from tkinter import messagebox
 
-import debugpy
-
-# from openpyxl import load_workbook
-import xlwings as xw
 from dateutil import parser
 from dateutil.relativedelta import relativedelta
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+# Excel (xlwings) and the dialogs (tkinter) are not available on headless linux hosts
+try:
+    import xlwings as xw
+except ImportError:
+    xw = None
+try:
+    import tkinter as tk
+    from tkinter import messagebox
+except ImportError:
+    tk = None
+try:
+    import debugpy
+except ImportError:
+    debugpy = None
 
 # Import handling for both direct execution and module execution
 try:
+    from .helper import config
+    from .helper.toggl_cache import handle_refresh_flag
     from .helper.toggl_parse_data import get_toggl_time_entries
 except ImportError:
     # Direct execution fallback
+    from helper import config  # type: ignore
+    from helper.toggl_cache import handle_refresh_flag  # type: ignore
     from helper.toggl_parse_data import get_toggl_time_entries  # type: ignore
 
+# all indexes are 0 based like in xlwings, openpyxl adds 1
+last_row_before_days_of_month = 4  # days of month start after row 5 (or 4 in xlwings)
+anw_project_column_start = 7  # H column
+anw_project_title_row = 3  # row 4 because xlwings starts with 0
+anw_last_column = 200
+switch_column_title = "angerechn. Reisezeit"
+# "xlwings" edits the workbook in a running Excel, "openpyxl" edits the file without Excel
+anw_backend = getattr(
+    config, "anw_backend", "xlwings" if xw is not None else "openpyxl"
+)
+# "diff" reads the sheet once and writes only the changed cells, "full" rewrites all columns
+anw_write_mode = getattr(config, "anw_write_mode", "diff")
+# folder of the ANW files, the OneDrive folder of the platform if not configured
+anw_folder = getattr(config, "anw_folder", None)
+
+
+# tkinter can be installed on hosts without a display, tk.Tk() fails there
+def dialogs_available():
+    if tk is None:
+        return False
+    if sys.platform in ("win32", "darwin"):
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+# project columns of the title row: {is travel: {first 4 chars of the title: column}}
+# projects are left of the "angerechn. Reisezeit" switch column, travel projects right of it
+def build_anw_header_index(title_row):
+    switch_col_number = -1
+    for col in range(anw_project_column_start, min(100, len(title_row))):
+        if title_row[col] == switch_column_title:
+            switch_col_number = col
+            break
+    if switch_col_number == -1:
+        logging.error('Column "angerechn. Reisezeit" not found in row 4 of the ANW')
+        raise KeyError('Column "angerechn. Reisezeit" not found in row 4 of the ANW')
+
+    header_index = {False: {}, True: {}}
+    for is_travel, col_start, col_end in (
+        (False, anw_project_column_start, switch_col_number - 1),
+        (True, switch_col_number + 1, anw_last_column),
+    ):
+        for col in range(col_start, min(col_end, len(title_row))):
+            cell_value = title_row[col]
+            if cell_value is None or cell_value == "":
+                continue
+            header_index[is_travel].setdefault(str(cell_value)[:4], col)
+    return header_index
+
+
+# the values of all cells to write: ({project column: 31 day values}, 31 start times, 31 end times)
+def anw_column_values(time_entry_list, workingtime_by_day_list, header_index):
+    project_columns = {}
+    for project in time_entry_list:
+        logging.debug("project: " + project)
+        project_col = header_index["reisen" in project.lower()].get(project[:4])
+        if project_col is None:
+            logging.error('project "' + str(project) + '" not found in excel')
+            raise KeyError('project "' + str(project) + '" not found in excel')
+
+        col_data = [None] * 31
+        for date_str in time_entry_list[project]:
+            logging.debug("date: " + date_str)
+            logging.debug("hours: " + str(time_entry_list[project][date_str]["hours"]))
+            day = parser.parse(date_str).day
+            col_data[day - 1] = time_entry_list[project][date_str]["hours"]
+        project_columns[project_col] = col_data
+
+    start_data = [None] * 31
+    end_data = [None] * 31
+    for date_str in workingtime_by_day_list:
+        logging.debug("date: " + str(date_str))
+        logging.debug("hours: " + str(workingtime_by_day_list[date_str]))
+
+        day = parser.parse(date_str).day
+        if workingtime_by_day_list[date_str]["endtime"].hour == 0:
+            hour = 24
+        else:
+            hour = int(workingtime_by_day_list[date_str]["endtime"].strftime("%H"))
+
+        start_data[day - 1] = (
+            workingtime_by_day_list[date_str]["starttime"].hour
+            + workingtime_by_day_list[date_str]["starttime"].minute / 100
+        )
+        end_data[day - 1] = (
+            hour + workingtime_by_day_list[date_str]["endtime"].minute / 100
+        )
+    return (project_columns, start_data, end_data)
+
+
+def _same_cell_value(old, new):
+    if old is None or old == "":
+        return new is None
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        return abs(old - new) < 1e-9
+    return old == new
+
+
+# cells of the day block that differ from the current sheet: {(day index, column): (old, new)}
+# day_rows are the 31 day rows of the sheet starting with column A
+def anw_cell_changes(day_rows, project_columns, start_data, end_data):
+    wanted = {}
+    for project_col, col_data in project_columns.items():
+        for day, value in enumerate(col_data):
+            wanted[(day, project_col)] = value
+    for day in range(31):
+        wanted[(day, 2)] = start_data[day]
+        wanted[(day, 3)] = end_data[day]
+
+    changes = {}
+    for (day, col), new in wanted.items():
+        row = day_rows[day] if day < len(day_rows) else ()
+        old = row[col] if col < len(row) else None
+        if not _same_cell_value(old, new):
+            changes[(day, col)] = (old, new)
+    return changes
+
+
+# rectangles (first day, last day, first column, last column) covering exactly the changed cells
+# consecutive changed days of a column form a run, neighbouring columns with the same run are merged
+def anw_change_ranges(changes):
+    runs = {}
+    for col in sorted({col for _, col in changes}):
+        days = sorted(day for day, changed_col in changes if changed_col == col)
+        first = days[0]
+        for previous, day in zip(days, days[1:] + [None]):
+            if day != previous + 1:
+                runs.setdefault((first, previous), []).append(col)
+                first = day
+
+    ranges = []
+    for (first_day, last_day), cols in runs.items():
+        first = cols[0]
+        for previous, col in zip(cols, cols[1:] + [None]):
+            if col != previous + 1:
+                ranges.append((first_day, last_day, first, previous))
+                first = col
+    return sorted(ranges)
+
+
+def log_anw_changes(changes, title_row):
+    if not changes:
+        logging.info("ANW is up to date, no cells changed")
+        return
+    logging.info(str(len(changes)) + " ANW cells changed:")
+    first_row = last_row_before_days_of_month + 2
+    for (day, col), (old, new) in sorted(
+        changes.items(), key=lambda item: (item[0][1], item[0][0])
+    ):
+        title = title_row[col] if col < len(title_row) else None
+        logging.info(
+            f"  {get_column_letter(col + 1)}{first_row + day} day {day + 1:2} "
+            f"{title or ''}: {old} -> {new}"
+        )
+
+
+# file based alternative to update_entries_in_anw_new, needs neither Excel nor a display
+# Excel formulas are not calculated, so the new overtime hours are unknown and None is returned
+def update_entries_in_anw_with_openpyxl(
+    time_entry_list, folder, file, workingtime_by_day_list
+):
+    logging.debug("In update_entries_in_anw_with_openpyxl")
+
+    wb = load_workbook(folder + file)
+    anw = wb["ANW"]
+    # header row and day block in one pass
+    block = list(
+        anw.iter_rows(
+            min_row=anw_project_title_row + 1,
+            max_row=last_row_before_days_of_month + 32,
+            max_col=anw_last_column,
+            values_only=True,
+        )
+    )
+    title_row = block[0]
+    project_columns, start_data, end_data = anw_column_values(
+        time_entry_list,
+        workingtime_by_day_list,
+        build_anw_header_index(title_row),
+    )
+
+    first_row = last_row_before_days_of_month + 2
+    if anw_write_mode == "diff":
+        changes = anw_cell_changes(
+            block[last_row_before_days_of_month + 1 - anw_project_title_row :],
+            project_columns,
+            start_data,
+            end_data,
+        )
+        log_anw_changes(changes, title_row)
+        for (day, col), (old, new) in changes.items():
+            anw.cell(row=first_row + day, column=col + 1).value = new
+    else:
+        for project_col, col_data in project_columns.items():
+            for day, value in enumerate(col_data):
+                anw.cell(row=first_row + day, column=project_col + 1).value = value
+        for day, (start, end) in enumerate(zip(start_data, end_data)):
+            anw.cell(row=first_row + day, column=3).value = start
+            anw.cell(row=first_row + day, column=4).value = end
+    wb.save(folder + file)
+    wb.close()
+
+    logging.info(
+        "Saved " + file + " without Excel, open it to check the calculated overtime"
+    )
+    logging.debug("End of update_entries_in_anw_with_openpyxl")
+    return None
+
+
+# writes the project hours and working times of a month into an open xlwings ANW sheet
+def fill_anw_sheet(anw, time_entry_list, workingtime_by_day_list):
+    first_row = last_row_before_days_of_month + 1
+    if anw_write_mode == "diff":
+        # header row and day block in one COM call
+        block = anw[anw_project_title_row : first_row + 31, 0:anw_last_column].value
+        title_row = block[0]
+    else:
+        # Resolve switch and project columns once from row 4
+        title_row = anw[anw_project_title_row, 0:anw_last_column].value
+    project_columns, start_data, end_data = anw_column_values(
+        time_entry_list,
+        workingtime_by_day_list,
+        build_anw_header_index(title_row),
+    )
+
+    if anw_write_mode == "diff":
+        changes = anw_cell_changes(
+            block[first_row - anw_project_title_row :],
+            project_columns,
+            start_data,
+            end_data,
+        )
+        log_anw_changes(changes, title_row)
+        # one COM call per rectangle of changed cells
+        for first_day, last_day, first_col, last_col in anw_change_ranges(changes):
+            anw[
+                first_row + first_day : first_row + last_day + 1,
+                first_col : last_col + 1,
+            ].value = [
+                [changes[(day, col)][1] for col in range(first_col, last_col + 1)]
+                for day in range(first_day, last_day + 1)
+            ]
+        return
+
+    # write each project column in one COM call
+    for project_col, col_data in project_columns.items():
+        anw[first_row : first_row + 31, project_col : project_col + 1].value = [
+            [v] for v in col_data
+        ]
+
+    # Working times per day, both columns in one COM call
+    anw[first_row : first_row + 31, 2:4].value = [
+        [s, e] for s, e in zip(start_data, end_data)
+    ]
+
+
+# moves the template sheet to the next month and carries the overtime over, returns the new month
+def roll_over_anw(anw, new_overtimehours):
+    date_obj = anw["M1"].value
+    new_date = date_obj + relativedelta(months=1)
+    anw["M1"].value = new_date
+
+    anw["F39"].value = new_overtimehours
+    return new_date
+
 
 def update_entries_in_anw_new(time_entry_list, folder, file, workingtime_by_day_list):
     logging.debug("In update_entries_in_anw_new")
@@ -32,98 +312,7 @@ def update_entries_in_anw_new(time_entry_list, folder, file, workingtime_by_day_
 
         try:
             anw = wb.sheets["ANW"]
-
-            last_row_before_days_of_month = (
-                4  # days of month start after row 5 (or 4 in xlwings)
-            )
-            anw_project_column_start = 7  # H column
-            anw_project_title_row = 3  # row 4 because xlwings starts with 0
-
-            # Resolve switch column once (same for all projects)
-            switch_col_number = -1
-            row_values = anw[anw_project_title_row, anw_project_column_start:100].value
-            for idx, cell_value in enumerate(row_values):
-                if cell_value == "angerechn. Reisezeit":
-                    switch_col_number = anw_project_column_start + idx
-                    break
-
-            if switch_col_number == -1:
-                logging.error(
-                    'Column "angerechn. Reisezeit" not found in row 4 of the ANW'
-                )
-                raise KeyError(
-                    'Column "angerechn. Reisezeit" not found in row 4 of the ANW'
-                )
-
-            # Enter working hours
-            for project in time_entry_list:
-                logging.debug("project: " + project)
-
-                if "reisen" not in project.lower():
-                    col_start = anw_project_column_start
-                    col_end = switch_col_number - 1
-                else:
-                    col_start = switch_col_number + 1
-                    col_end = 200
-
-                project_col = -1
-                excel_proj = "empty"
-
-                # search project column by project name in row 4
-                row_values = anw[anw_project_title_row, col_start:col_end].value
-                for idx, cell_value in enumerate(row_values):
-                    if cell_value is None or cell_value == "":
-                        continue
-                    excel_proj = str(cell_value)[:4]
-                    if excel_proj == project[:4]:
-                        project_col = col_start + idx
-                        break
-                if project_col == -1 or excel_proj != project[:4]:
-                    logging.error('project "' + str(project) + '" not found in excel')
-                    raise KeyError('project "' + str(project) + '" not found in excel')
-
-                # Collect all day values, then write the whole column in one COM call
-                col_data = [None] * 31
-                for date_str in time_entry_list[project]:
-                    logging.debug("date: " + date_str)
-                    logging.debug(
-                        "hours: " + str(time_entry_list[project][date_str]["hours"])
-                    )
-                    day = parser.parse(date_str).day
-                    col_data[day - 1] = time_entry_list[project][date_str]["hours"]
-
-                first_row = last_row_before_days_of_month + 1
-                anw[first_row : first_row + 31, project_col : project_col + 1].value = [
-                    [v] for v in col_data
-                ]
-
-            # Working times per day — collect all days, then write both columns in one COM call
-            start_data = [None] * 31
-            end_data = [None] * 31
-            for date_str in workingtime_by_day_list:
-                logging.debug("date: " + str(date_str))
-                logging.debug("hours: " + str(workingtime_by_day_list[date_str]))
-
-                day = parser.parse(date_str).day
-                if workingtime_by_day_list[date_str]["endtime"].hour == 0:
-                    hour = 24
-                else:
-                    hour = int(
-                        workingtime_by_day_list[date_str]["endtime"].strftime("%H")
-                    )
-
-                start_data[day - 1] = (
-                    workingtime_by_day_list[date_str]["starttime"].hour
-                    + workingtime_by_day_list[date_str]["starttime"].minute / 100
-                )
-                end_data[day - 1] = (
-                    hour + workingtime_by_day_list[date_str]["endtime"].minute / 100
-                )
-
-            first_row = last_row_before_days_of_month + 1
-            anw[first_row : first_row + 31, 2:4].value = [
-                [s, e] for s, e in zip(start_data, end_data)
-            ]
+            fill_anw_sheet(anw, time_entry_list, workingtime_by_day_list)
 
         finally:
             app.calculation = "automatic"
@@ -171,13 +360,7 @@ def adjust_anws_for_new_month(
     app = xw.App()
     file_original = prefix + yearmonth + suffix
     with xw.Book(folder + file_original) as wb:
-        anw = wb.sheets["ANW"]
-
-        date_obj = anw["M1"].value
-        new_date = date_obj + relativedelta(months=1)
-        anw["M1"].value = new_date
-
-        anw["F39"].value = new_overtimehours
+        new_date = roll_over_anw(wb.sheets["ANW"], new_overtimehours)
 
     new_filename = prefix + new_date.strftime("%Y%m") + suffix
     # rename original file for new month
@@ -191,6 +374,113 @@ def adjust_anws_for_new_month(
     app.quit()
 
 
+# {yyyymm: entries of that month} of a dictionary keyed by "yyyy-mm-dd" dates
+def _split_days_by_month(days):
+    months = {}
+    for date_str in days:
+        months.setdefault(date_str[:4] + date_str[5:7], {})[date_str] = days[date_str]
+    return months
+
+
+# {yyyymm: {project: {date: ...}}} of the project hours
+def _split_projects_by_month(time_entry_list):
+    months = {}
+    for project in time_entry_list:
+        for yearmonth, days in _split_days_by_month(time_entry_list[project]).items():
+            months.setdefault(yearmonth, {})[project] = days
+    return months
+
+
+# catches up several months in one run: toggl is fetched once for the whole span, then every
+# month from the template month to last_month (yyyymm) is filled and rolled over in one
+# hidden Excel instance, the overtime of each month is carried into the next template
+def process_anw_months(folder, file, last_month):
+    logging.debug("In process_anw_months")
+    if xw is None:
+        raise Exception("Processing several months needs Excel (xlwings)")
+
+    match = re.search(r"^(Anw_PrV_)(\d{6})(\.xlsx)$", file)
+    if not match:
+        raise ValueError(
+            f"Filename '{file}' is no ANW template of the format 'Anw_PrV_YYYYMM.xlsx'"
+        )
+    prefix, yearmonth, suffix = match.groups()
+    start_date = datetime.strptime(yearmonth, "%Y%m").date()
+    end_date = datetime.strptime(last_month, "%Y%m").date() + relativedelta(months=1)
+    months = []
+    month = start_date
+    while month < end_date:
+        months.append(month.strftime("%Y%m"))
+        month += relativedelta(months=1)
+    if not months:
+        logging.info(f"No pending months between {yearmonth} and {last_month}")
+        return
+
+    root = tk.Tk()
+    root.withdraw()  # Hides the main window
+    result = messagebox.askyesno(
+        "Confirmation",
+        f"Sollen die Monate {months[0]} bis {months[-1]} eingetragen und die Excel Dateien umbenannt werden?",
+    )
+    root.destroy()
+    if not result:
+        logging.info("User declined to process the months")
+        sys.exit()
+
+    time_entry_list, workingtime_by_day_list, time_entry_list_detail = (
+        get_toggl_time_entries(start_date, end_date, window="month")
+    )
+    entries_by_month = _split_projects_by_month(time_entry_list)
+    workingtimes_by_month = _split_days_by_month(workingtime_by_day_list)
+
+    app = xw.App(visible=False, add_book=False)
+    app.display_alerts = False
+    app.screen_updating = False
+    try:
+        for yearmonth in months:
+            template = prefix + yearmonth + suffix
+            filled = prefix + yearmonth + "n" + suffix
+            shutil.copy(folder + template, folder + filled)
+
+            wb = app.books.open(folder + filled)
+            # calculation can only be switched with an open book
+            app.calculation = "manual"
+            anw = wb.sheets["ANW"]
+            fill_anw_sheet(
+                anw,
+                entries_by_month.get(yearmonth, {}),
+                workingtimes_by_month.get(yearmonth, {}),
+            )
+            app.calculate()
+            new_overtimehours = anw["F42"].value
+            # excel saves the calculation mode in the file, it must open with automatic again
+            app.calculation = "automatic"
+            wb.save()
+            wb.close()
+
+            wb = app.books.open(folder + template)
+            app.calculation = "automatic"
+            new_date = roll_over_anw(wb.sheets["ANW"], new_overtimehours)
+            wb.save()
+            wb.close()
+
+            new_template = prefix + new_date.strftime("%Y%m") + suffix
+            os.rename(folder + template, folder + new_template)
+            os.rename(folder + filled, folder + template)
+            logging.info(
+                f"Filled '{template}', overtime {new_overtimehours} carried over to '{new_template}'"
+            )
+    finally:
+        # the books are saved with automatic calculation, after an error the app is reset
+        # before it is closed, switching needs an open book
+        if app.books:
+            app.calculation = "automatic"
+        app.screen_updating = True
+        app.quit()
+
+    logging.debug("End of process_anw_months")
+
+
 # Function to ask the user to select an Excel file using a list box
 def ask_user_to_select_file(files):
     root = tk.Tk()
@@ -231,28 +521,16 @@ def ask_user_to_select_file(files):
     return selected_file
 
 
-if __name__ == "__main__":
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)s %(message)s",
-        handlers=[
-            # logging.FileHandler("debug.log"), # For logging to file
-            logging.StreamHandler()
-        ],
-    )
-    if debugpy.is_client_connected():
-        logging.getLogger().setLevel(logging.DEBUG)
-
-    logging.info("----------------------------------------")
-    logging.info("Starting Toggl to ANW Transfer")
-    logging.debug("Debugging is enabled")
-
+# the folder of the ANW files and the template to fill, asks if there are several
+def find_anw_file():
     linux_folder = (
         "/mnt/c/Users/PrV/OneDrive - viadee Unternehmensberatung AG/Arbeitsnachweis/"
     )
     mac_folder = "/Users/prv/Library/CloudStorage/OneDrive-viadeeUnternehmensberatungAG/Arbeitsnachweis/"
     windows_folder = linux_folder.replace("/mnt/c", "C:").replace("/", "\\")
-    if sys.platform == "linux":  # execution in WSL Linux
+    if anw_folder is not None:
+        folder = os.path.join(anw_folder, "")
+    elif sys.platform == "linux":  # execution in WSL Linux
         folder = linux_folder
     elif sys.platform == "darwin":  # execution on macOS
         folder = mac_folder
@@ -266,7 +544,14 @@ if __name__ == "__main__":
     ]
 
     # Check if there are multiple Excel files
-    if len(excel_files) > 1:
+    if len(excel_files) > 1 and not dialogs_available():
+        # no dialog on headless hosts, the most recently changed file is the current ANW
+        file = max(excel_files, key=lambda f: os.path.getmtime(os.path.join(folder, f)))
+        logging.warning(
+            "Multiple Excel files found and no dialog available, using the newest: "
+            + file
+        )
+    elif len(excel_files) > 1:
         file = ask_user_to_select_file(excel_files)
         if not file:
             raise FileNotFoundError("User did not select a valid file.")
@@ -274,26 +559,25 @@ if __name__ == "__main__":
         file = excel_files[0]
     else:
         raise FileNotFoundError(f"No Excel files found in folder: {folder}")
+    return (folder, file)
+
 
+# (first day of the month of the ANW file, first day of the next month)
+def anw_month_range(file):
     match = re.search(r"(Anw_PrV_)(\d{6}).*(\.xlsx)$", file)
-    matchOrig = re.search(r"Anw_PrV_(\d{6})\.xlsx$", file)
-    if match:
-        fileshort = match.group(2)
-        start_date = datetime.strptime(fileshort, "%Y%m").date().replace(day=1)
-    else:
+    if not match:
         raise ValueError(
             f"Filename '{file}' does not match the expected format 'Anw_PrV_YYYYMM*.xlsx'"
         )
-
+    start_date = datetime.strptime(match.group(2), "%Y%m").date().replace(day=1)
     end_date = (start_date + timedelta(days=32)).replace(day=1)  # start of next month
-    logging.debug("Start Date: " + str(start_date))
-    logging.debug("End Date: " + str(end_date))
+    return (start_date, end_date)
 
-    time_entry_list, workingtime_by_day_list, time_entry_list_detail = (
-        get_toggl_time_entries(start_date, end_date)
-    )
 
-    # time_entry_list = pickle.load(open("time_entry_list.pickle", "rb"))
+# fills the month of the ANW file and moves the template on to the next month
+def transfer_anw_month(folder, file, time_entry_list, workingtime_by_day_list):
+    match = re.search(r"(Anw_PrV_)(\d{6}).*(\.xlsx)$", file)
+    matchOrig = re.search(r"Anw_PrV_(\d{6})\.xlsx$", file)
     if matchOrig:
         file_new = file.replace(".xlsx", "n.xlsx")
         # Copy the file before making updates
@@ -308,16 +592,59 @@ if __name__ == "__main__":
             )
         file = file_new
 
-    # on_windows = True;
-    # if on_windows:
-    new_overtimehours = update_entries_in_anw_new(
-        time_entry_list, folder, file, workingtime_by_day_list
+    if anw_backend == "xlwings":
+        new_overtimehours = update_entries_in_anw_new(
+            time_entry_list, folder, file, workingtime_by_day_list
+        )
+        adjust_anws_for_new_month(
+            folder,
+            file,
+            match.group(1),
+            match.group(2),
+            match.group(3),
+            new_overtimehours,
+        )
+    else:
+        # the month switch needs the overtime calculated by Excel
+        update_entries_in_anw_with_openpyxl(
+            time_entry_list, folder, file, workingtime_by_day_list
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+        handlers=[
+            # logging.FileHandler("debug.log"), # For logging to file
+            logging.StreamHandler()
+        ],
     )
-    adjust_anws_for_new_month(
-        folder, file, match.group(1), match.group(2), match.group(3), new_overtimehours
+    if debugpy is not None and debugpy.is_client_connected():
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    logging.info("----------------------------------------")
+    logging.info("Starting Toggl to ANW Transfer")
+    logging.debug("Debugging is enabled")
+
+    # --refresh-toggl-metadata reloads the toggl clients and projects
+    handle_refresh_flag(sys.argv)
+    folder, file = find_anw_file()
+
+    # python toggl_to_anw_transfer.py 202406 fills every month up to June 2024 in one run
+    if len(sys.argv) > 1:
+        process_anw_months(folder, file, sys.argv[1])
+        logging.info("Finished Toggl to Anw Transfer")
+        sys.exit()
+
+    start_date, end_date = anw_month_range(file)
+    logging.debug("Start Date: " + str(start_date))
+    logging.debug("End Date: " + str(end_date))
+
+    time_entry_list, workingtime_by_day_list, time_entry_list_detail = (
+        get_toggl_time_entries(start_date, end_date)
     )
-    # else:
-    #     update_entries_in_anw_with_openpyxl(time_entry_list, folder, file, workingtime_by_day_list)
+    transfer_anw_month(folder, file, time_entry_list, workingtime_by_day_list)
 
     logging.info("Finished Toggl to Anw Transfer")
     logging.info("Finished Toggl to Anw Transfer")
@@ -1,149 +1,336 @@
 import logging
-from datetime import date, datetime
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 
 from dateutil.relativedelta import relativedelta
-from jira import JIRA
 
 import helper.config as config
-from helper.toggl_parse_data import get_toggl_time_entries
+from helper import jira_client, jira_reconcile
+from helper.fixtures import fixtures_active, fixtures_replaying, recorded
+from helper.jira_journal import JiraSyncJournal
+from helper.toggl_cache import handle_refresh_flag
+from helper.toggl_parse_data import get_changed_toggl_aggregates, get_toggl_aggregates
 
 jira_url = "https://eucon.atlassian.net"
 
 
-def get_eucon_jira_worklog_list(start_date, end_date):
+# worklog/list accepts at most 1000 ids per request
+worklog_batch_size = 1000
+# watch mode polls toggl this often and writes without asking unless configured otherwise
+watch_interval_seconds = getattr(config, "jira_watch_interval_seconds", 300)
+watch_policy = getattr(config, "jira_watch_policy", "auto")
+
+
+def _is_own_worklog(worklog):
+    author = worklog["author"]
+    return (
+        author.get("accountId") == config.jira_account_id
+        or author.get("emailAddress") == config.jira_user
+    )
+
+
+def _is_in_range(worklog, start_date, end_date):
+    return _is_own_worklog(worklog) and (
+        str(start_date) <= worklog["started"][:10] <= str(end_date)
+    )
+
+
+# instead of one worklogs() call per issue, the ids of all worklogs changed since start_date are
+# listed and loaded in batches, worklogs booked in advance before start_date are not found
+def _fetch_worklogs_bulk(jira, start_date, end_date):
+    since = int(datetime.combine(start_date, datetime.min.time()).timestamp() * 1000)
+    worklog_ids = jira_client.get_updated_worklog_ids(jira, since)
+
+    batches = [
+        worklog_ids[offset : offset + worklog_batch_size]
+        for offset in range(0, len(worklog_ids), worklog_batch_size)
+    ]
+    worklogs_by_issue = {}
+    with ThreadPoolExecutor(max_workers=jira_client.max_workers) as executor:
+        for worklogs in executor.map(
+            lambda batch: jira_client.get_worklogs_by_ids(jira, batch),
+            batches,
+        ):
+            for worklog in worklogs:
+                if _is_in_range(worklog, start_date, end_date):
+                    worklogs_by_issue.setdefault(worklog["issueId"], []).append(worklog)
+    if not worklogs_by_issue:
+        return []
+
+    # worklogs only know the issue id, the keys are resolved with one search
+    issues = jira_client.search_all_issues(
+        jira, "id in (" + ", ".join(worklogs_by_issue) + ")"
+    )
+    return [
+        {"key": issue["key"], "worklogs": worklogs_by_issue[issue["id"]]}
+        for issue in issues
+    ]
+
+
+# the issues with own worklogs in the range and all their worklogs, loaded concurrently
+def _fetch_worklogs_by_issue(jira, start_date, end_date):
+    jql = f"worklogDate >= {start_date} AND worklogDate <= {end_date} AND worklogAuthor = '{config.jira_account_id}'"
+    issue_keys = [issue["key"] for issue in jira_client.search_all_issues(jira, jql)]
+    worklogs = jira_client.get_worklogs_of_issues(jira, issue_keys)
+    return [
+        {
+            "key": key,
+            "worklogs": [
+                worklog
+                for worklog in worklogs[key]
+                if _is_in_range(worklog, start_date, end_date)
+            ],
+        }
+        for key in issue_keys
+    ]
+
+
+# only the worklogs of the given tickets, for reruns that look at a few changed cells
+def _fetch_worklogs_of_tickets(jira, tickets, start_date, end_date):
+    worklogs = jira_client.get_worklogs_of_issues(jira, tickets)
+    return [
+        {
+            "key": key,
+            "worklogs": [
+                worklog
+                for worklog in worklogs[key]
+                if _is_in_range(worklog, start_date, end_date)
+            ],
+        }
+        for key in tickets
+    ]
+
+
+# raw json of all issues with own worklogs in the range and their worklogs, recorded in fixture mode
+# jira_worklog_fetch = "issues" searches the issues and loads their worklogs instead, for accounts
+# that may not read the worklogs of other users
+def _fetch_jira_worklogs(start_date, end_date, tickets=None):
+    jira = jira_client.get_jira(jira_url)
+    if tickets is not None:
+        return _fetch_worklogs_of_tickets(jira, tickets, start_date, end_date)
+    if getattr(config, "jira_worklog_fetch", "bulk") == "issues":
+        return _fetch_worklogs_by_issue(jira, start_date, end_date)
+    return _fetch_worklogs_bulk(jira, start_date, end_date)
+
+
+# returns ({date: {ticket: hours}}, {date: {ticket: [worklog id, ...]}})
+# the ids let the sync update existing worklogs instead of deleting and adding them again
+# tickets limits the request to the worklogs of these issues
+def get_eucon_jira_worklogs(start_date, end_date, tickets=None):
     logging.info(
         "get eucon jira tempo worklog for " + str(start_date) + " to " + str(end_date)
     )
     # get booked time entries in Jira
-    jira = JIRA(
-        basic_auth=(config.jira_user, config.jira_token), options={"server": jira_url}
+    key = "worklogs/" + str(start_date) + "/" + str(end_date)
+    if tickets is not None:
+        tickets = sorted(tickets)
+        key += "?tickets=" + ",".join(tickets)
+    issues = recorded(
+        "jira", key, lambda: _fetch_jira_worklogs(start_date, end_date, tickets)
     )
-    jql = f"worklogDate >= {start_date} AND worklogDate <= {end_date} AND worklogAuthor = '{config.jira_account_id}'"
-    issues = jira.search_issues(jql, maxResults=1000)
 
     # Create a dictionary for the request body
     jiraWorklogList = {}
+    jiraWorklogIds = {}
     for issue in issues:
-        # create jira api request for worklog of issue
-        worklogs = jira.worklogs(issue)
-        for worklog in worklogs:
+        for worklog in issue["worklogs"]:
             worklogDate = datetime.strptime(
-                worklog.started[: worklog.started.index("T")], "%Y-%m-%d"
+                worklog["started"][: worklog["started"].index("T")], "%Y-%m-%d"
             ).date()
             worklogDateStr = str(worklogDate)
-            if (
-                hasattr(worklog.author, "emailAddress")
-                and worklog.author.emailAddress == config.jira_user
-                and start_date <= worklogDate <= end_date
-            ):
+            if _is_own_worklog(worklog) and start_date <= worklogDate <= end_date:
                 if jiraWorklogList.get(worklogDateStr) is None:
                     jiraWorklogList[worklogDateStr] = {}
 
-                if jiraWorklogList[worklogDateStr].get(issue.key) is None:  # type: ignore
-                    jiraWorklogList[worklogDateStr][issue.key] = (
-                        worklog.timeSpentSeconds / 3600
-                    )  # type: ignore
+                if jiraWorklogList[worklogDateStr].get(issue["key"]) is None:
+                    jiraWorklogList[worklogDateStr][issue["key"]] = (
+                        worklog["timeSpentSeconds"] / 3600
+                    )
                 else:
-                    jiraWorklogList[worklogDateStr][issue.key] += (
-                        worklog.timeSpentSeconds / 3600
+                    jiraWorklogList[worklogDateStr][issue["key"]] += (
+                        worklog["timeSpentSeconds"] / 3600
                     )
+                jiraWorklogIds.setdefault(worklogDateStr, {}).setdefault(
+                    issue["key"], []
+                ).append(worklog["id"])
+
+    return (jiraWorklogList, jiraWorklogIds)
+
+
+def get_eucon_jira_worklog_list(start_date, end_date):
+    return get_eucon_jira_worklogs(start_date, end_date)[0]
 
-    # pickle.dump(jiraWorklogList, open("jiraWorklogList.pickle", "wb"))
-    return jiraWorklogList
 
+def _approve(plan, policy, dry_run):
+    jira_reconcile.log_plan(plan)
+    if policy is None:
+        policy = jira_reconcile.default_policy
+    if dry_run and policy == "ask":
+        # nothing is written, so every possible change is listed without questions
+        policy = "auto"
+    return jira_reconcile.approve_plan(plan, policy)
 
-def delete_worklogs_for_ticket_and_date(jira, ticket, date_to_delete):
-    issue = jira.issue(ticket, fields="worklog")
-    worklogs = jira.worklogs(issue)
-    for worklog in worklogs:
-        worklog_date = worklog.started[:10]
-        worklog_author_email = (
-            worklog.author.emailAddress
-            if hasattr(worklog.author, "emailAddress")
-            else None
+
+# aggregates is the TogglAggregates of get_toggl_aggregates
+# the whole difference is planned first, then the approved changes are written in parallel
+# with the worklog ids of get_eucon_jira_worklogs differing worklogs are updated in place
+# start_date and end_date are the toggl range of the aggregates, only there worklogs are deleted
+def add_missing_entries_for_eucon(
+    aggregates,
+    jiraWorklogList,
+    policy=None,
+    dry_run=False,
+    jiraWorklogIds=None,
+    start_date=None,
+    end_date=None,
+):
+    plan = jira_reconcile.build_plan(
+        aggregates,
+        jiraWorklogList,
+        worklog_ids=jiraWorklogIds,
+        start_date=start_date,
+        end_date=end_date,
+    )
+    changes = _approve(plan, policy, dry_run)
+    if dry_run:
+        jira_reconcile.execute_plan(None, changes, dry_run)
+        return
+    jira_reconcile.execute_plan(jira_client.get_jira(jira_url), changes)
+
+
+# like add_missing_entries_for_eucon, but (ticket, date) cells whose toggl entries did not change
+# since their last sync are skipped, jira is only asked for the tickets of the changed cells
+# dates limits the sync to these days, the aggregates then only need to cover them
+def sync_eucon_worklogs(
+    aggregates, start_date, end_date, policy=None, dry_run=False, dates=None
+):
+    with JiraSyncJournal() as journal:
+        changed, removed = journal.changed_cells(
+            aggregates, start_date, end_date, dates
+        )
+        if not jira_reconcile.delete_missing:
+            # their worklogs are kept in jira and no longer followed
+            for ticket, date in removed:
+                journal.forget(ticket, date)
+            removed = set()
+        cells = changed | removed
+        logging.info(
+            str(len(cells))
+            + " of "
+            + str(len(aggregates.tickets) + len(removed))
+            + " ticket cells changed since the last sync"
+        )
+        if not cells:
+            return
+
+        jiraWorklogList, jiraWorklogIds = get_eucon_jira_worklogs(
+            start_date, end_date, {ticket for ticket, date in cells}
+        )
+        plan = jira_reconcile.build_plan(
+            aggregates,
+            jiraWorklogList,
+            worklog_ids=jiraWorklogIds,
+            cells=cells,
+            start_date=start_date,
+            end_date=end_date,
+        )
+        changes = _approve(plan, policy, dry_run)
+        if dry_run:
+            jira_reconcile.execute_plan(None, changes, dry_run)
+            return
+
+        def journal_change(change, worklog_id):
+            if change.action == "delete":
+                journal.forget(change.ticket, change.date)
+            else:
+                journal.record(aggregates, change.ticket, change.date, worklog_id)
+
+        # cells that already match jira are journaled without writing anything
+        for change in plan:
+            if change.action == "unchanged":
+                journal_change(change, (change.worklog_ids or [None])[0])
+        jira_reconcile.execute_plan(
+            jira_client.get_jira(jira_url), changes, on_written=journal_change
+        )
+
+
+# jira_sync_policy "auto" runs unattended, jira_sync_dry_run only logs the changes
+def sync_toggl_to_jira(aggregates, start_date, end_date):
+    dry_run = getattr(config, "jira_sync_dry_run", False)
+    use_journal = getattr(config, "jira_sync_use_journal", True)
+    if fixtures_active():
+        # recordings must contain every cell and replays must not depend on the local journal
+        use_journal = False
+    if fixtures_replaying():
+        # the recorded worklogs are stale, changes planned from them must not reach jira
+        logging.info("replaying fixtures, jira is not written")
+        dry_run = True
+    if use_journal:
+        sync_eucon_worklogs(aggregates, start_date, end_date, dry_run=dry_run)
+    else:
+        jira_worklog_list, jira_worklog_ids = get_eucon_jira_worklogs(
+            start_date, end_date
         )
-        foundSome = False
-        if worklog_date == date_to_delete and worklog_author_email == config.jira_user:
-            worklog.delete(adjustEstimate="leave")
-            foundSome = True
-        if foundSome:
-            logging.info(
-                "Delete         entry on "
-                + worklog.started[:10]
-                + " with "
-                + str(worklog.timeSpentSeconds / 3600)
-                + "h for "
-                + ticket
-            )
-
-
-def add_missing_entries_for_eucon(timeEntryList, jiraWorklogList):
-    # add missing entries to Jira
-    jira = JIRA(
-        basic_auth=(config.jira_user, config.jira_token), options={"server": jira_url}
+        add_missing_entries_for_eucon(
+            aggregates,
+            jira_worklog_list,
+            dry_run=dry_run,
+            jiraWorklogIds=jira_worklog_ids,
+            start_date=start_date,
+            end_date=end_date,
+        )
+
+
+# one polling cycle: toggl is asked for the entries changed since the last cycle and only the
+# (ticket, date) cells of their days are synced, a cycle without changes is a single request
+# the first cycle (full) compares the whole range to catch up on changes made before
+def watch_cycle(start_date, end_date, full=False):
+    if full:
+        aggregates, dates = get_toggl_aggregates(start_date, end_date), None
+    else:
+        aggregates, dates = get_changed_toggl_aggregates(start_date, end_date)
+        if dates is not None and not dates:
+            logging.debug("no toggl changes")
+            return
+    logging.info(
+        "syncing "
+        + ("all days" if dates is None else ", ".join(sorted(dates)))
+        + " to jira"
+    )
+    sync_eucon_worklogs(
+        aggregates,
+        start_date,
+        end_date,
+        policy=watch_policy,
+        dry_run=getattr(config, "jira_sync_dry_run", False),
+        dates=dates,
     )
 
-    for project in timeEntryList:
-        if "2779 " in project:
-            for date in timeEntryList[project]:
-                for ticket in timeEntryList[project][date]:
-                    if (
-                        (
-                            jiraWorklogList.get(date) is None
-                            or jiraWorklogList[date].get(ticket) is None
-                            or jiraWorklogList[date][ticket]
-                            != timeEntryList[project][date][ticket]["hours"]
-                        )
-                        and ticket != "hours"
-                        and ticket != "description"
-                    ):
-                        # At this point it is known that the date and ticket worklog in Jira does not represent the logged time in toggl
-
-                        hours = timeEntryList[project][date][ticket]["hours"]
-                        desc = timeEntryList[project][date][ticket]["description"]
-                        if (
-                            jiraWorklogList.get(date) is not None
-                            and jiraWorklogList[date].get(ticket) is not None
-                            and jiraWorklogList[date][ticket] != hours
-                        ):
-                            hours_jira = jiraWorklogList[date].get(ticket)
-                            logging.info(
-                                "Wrong time in Jira. toggl: "
-                                + str(hours)
-                                + "h, Jira: "
-                                + str(hours_jira)
-                                + "h. "
-                                + ticket
-                                + " on "
-                                + str(date)
-                            )
-                            answer = input(
-                                "Should the entry nevertheless be added? the existing entries will be deleted beforhand. (y/n): "
-                            )
-                            if answer != "y":
-                                continue
-                            if answer == "y":
-                                # Before adding new entries, delete existing worklogs for the ticket on that date if any exist
-                                delete_worklogs_for_ticket_and_date(jira, ticket, date)
-                        # add missing entry to Jira
-                        logging.info(
-                            "Adding missing entry on "
-                            + date
-                            + " with "
-                            + str(hours)
-                            + "h for "
-                            + ticket
-                        )
-                        # date to datetime with timezone
-                        datetime_with_zone = datetime.strptime(
-                            date + "T00:00:00.000+0100", "%Y-%m-%dT%H:%M:%S.000%z"
-                        )
-                        jira.add_worklog(
-                            ticket,
-                            timeSpentSeconds=hours * 3600,
-                            started=datetime_with_zone,
-                            comment=desc,
-                        )
+
+# keeps the jira worklogs of the previous and the current month up to date until interrupted
+def watch_eucon_worklogs(interval_seconds=None):
+    if interval_seconds is None:
+        interval_seconds = watch_interval_seconds
+    if fixtures_active():
+        # polling needs the live responses and the journal
+        raise Exception("watch mode does not work with recorded or replayed fixtures")
+    logging.info(
+        "watching toggl every " + str(interval_seconds) + " seconds, ctrl+c stops"
+    )
+    full = True
+    while True:
+        start_date = date.today().replace(day=1) - relativedelta(months=1)
+        # today is included, its entries are synced while the day is still running
+        end_date = date.today() + timedelta(days=1)
+        try:
+            watch_cycle(start_date, end_date, full)
+            full = False
+        except Exception:
+            # toggl or jira being unavailable must not end the watch, the next cycle retries
+            logging.exception("watch cycle failed")
+        time.sleep(interval_seconds)
 
 
 if __name__ == "__main__":
@@ -157,6 +344,13 @@ if __name__ == "__main__":
     logging.info("Starting Toggl to Jira Transfer")
     logging.debug("Debugging is enabled")
 
+    # --refresh-toggl-metadata reloads the toggl clients and projects
+    handle_refresh_flag(sys.argv)
+    # python toggl_to_jira_transfer.py watch keeps syncing until it is stopped
+    if sys.argv[1:] == ["watch"]:
+        watch_eucon_worklogs()
+        sys.exit()
+
     # start_date = date(2023, 9, 1)
     # set start date to first day of previous month
     start_date = date.today().replace(day=1) - relativedelta(months=1)
@@ -165,16 +359,9 @@ if __name__ == "__main__":
     logging.debug("Start Date: " + str(start_date))
     logging.debug("End Date: " + str(end_date))
 
-    jira_worklog_list = get_eucon_jira_worklog_list(start_date, end_date)
-
-    # jira_worklog_list = pickle.load(open("jiraWorklogList.pickle", "rb"))
-
-    time_entry_list, workingtime_by_day_list, time_entry_list_detail = (
-        get_toggl_time_entries(start_date, end_date)
-    )
-
-    # time_entry_list = pickle.load(open("timeEntryList.pickle", "rb"))
+    # PY_SINGLE_SCRIPTS_FIXTURES=record|replay records or replays the toggl and jira responses
+    aggregates = get_toggl_aggregates(start_date, end_date)
 
-    add_missing_entries_for_eucon(time_entry_list, jira_worklog_list)
+    sync_toggl_to_jira(aggregates, start_date, end_date)
 
     logging.info("Finished Toggl to Jira Transfer")